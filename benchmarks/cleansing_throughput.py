@@ -0,0 +1,38 @@
+import re
+import sys
+import timeit
+
+from markdown_helper import MarkdownDocument
+
+from benchmarks.generator import generate_document
+
+
+def reference_cleansing(lines):
+    for line in MarkdownDocument._remove_existing_tocs(lines):
+        if line != '':
+            line = re.sub(MarkdownDocument.REG_SPACER_BETWEEN_HEADER_AND_LINK, '', line)
+            line = re.sub(MarkdownDocument.REG_INTERNAL_ANCHOR, '', line)
+            line = re.sub(MarkdownDocument.REG_INTERNAL_LINK, '', line)
+            if line:
+                yield line
+        else:
+            yield line
+
+
+def lines_per_second(cleanse, lines, repeat=5):
+    seconds = min(timeit.repeat(lambda: list(cleanse(lines)), number=1, repeat=repeat))
+    return len(lines) / seconds
+
+
+def main(lines=50000):
+    lines = MarkdownDocument(generate_document(lines=lines)).dump(with_toc=True, max_main_toc_level=1, extra_sub_toc_level=2)
+    assert list(MarkdownDocument._cleansing_generator(lines)) == list(reference_cleansing(lines))
+    reference = lines_per_second(reference_cleansing, lines)
+    current = lines_per_second(MarkdownDocument._cleansing_generator, lines)
+    print(f'{len(lines)} lines')
+    print(f'{"reference":>10} {reference:>12,.0f} lines/s')
+    print(f'{"current":>10} {current:>12,.0f} lines/s ({current / reference:.1f}x)')
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
@@ -0,0 +1,39 @@
+import random
+
+WORDS = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'harum', 'everti', 'laboramus', 'bonorum', 'nostrum', 'wisi', 'adipisci', 'molestiae']
+
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def _toc_block(rng, entries):
+    yield ''
+    yield '<!-- toc_start -->'
+    for entry in range(entries):
+        yield f'{"  " * rng.randrange(3)}* [{_text(rng, 3)}](#{entry + 1}_1)'
+    yield '<!-- toc_end -->'
+
+
+def generate_document(lines=10000, heading_density=0.1, depth_weights=(1, 3, 3, 1), toc_blocks=0, toc_entries=20, with_anchors=False, seed=0):
+    rng = random.Random(seed)
+    levels = range(1, len(depth_weights) + 1)
+    toc_positions = {int(lines * (block + 0.5) / toc_blocks) for block in range(toc_blocks)} if toc_blocks else set()
+    heading_number = 0
+    result = []
+    for position in range(lines):
+        if position in toc_positions:
+            result.extend(_toc_block(rng, toc_entries))
+        if rng.random() < heading_density:
+            heading_number += 1
+            level = rng.choices(levels, depth_weights)[0]
+            if with_anchors:
+                result.append(f'<a name="{heading_number}"></a>')
+                result.append(f'{"#" * level} [↖](#top)[↑](#{heading_number - 1})[↓](#{heading_number + 1}) {_text(rng, 4)}')
+            else:
+                result.append(f'{"#" * level} {_text(rng, 4)}')
+        elif rng.random() < 0.2:
+            result.append('')
+        else:
+            result.append(_text(rng, 12))
+    return result
@@ -0,0 +1,49 @@
+import sys
+import timeit
+from array import array
+
+from markdown_helper import HeadingIndex, HeadingIndices, MarkdownParser, _import_numpy
+
+from benchmarks.generator import generate_document
+
+
+def reference_indices(levels):
+    parser = MarkdownParser()
+    current_index = ()
+    indices = []
+    for level in levels:
+        new_index = parser._generate_index(current_index, level)
+        indices.append(HeadingIndices(current_index, new_index, None))
+        current_index = new_index
+    next_index = ()
+    for number in reversed(range(len(indices))):
+        indices[number] = HeadingIndices(indices[number].previous, indices[number].current, next_index)
+        next_index = indices[number].current
+    return [index.current for index in indices]
+
+
+def main(lines=200000, repeat=5):
+    raw_lines = generate_document(lines=lines, heading_density=0.5, depth_weights=(1, 3, 3, 3))
+    store = MarkdownParser().parse_compact(raw_lines)
+    levels = array('l', store.heading_levels)
+    assert list(HeadingIndex(levels)) == reference_indices(levels)
+    engines = [
+        ('reference', lambda: reference_indices(levels)),
+        ('array', lambda: HeadingIndex._compute(levels)),
+    ]
+    numpy = _import_numpy()
+    if numpy is not None:
+        assert HeadingIndex._compute_with_numpy(numpy, levels) == HeadingIndex._compute(levels)
+        engines.append(('numpy', lambda: HeadingIndex._compute_with_numpy(numpy, levels)))
+    engines.append(('paths', lambda: list(HeadingIndex(levels))))
+    print(f'{len(levels)} headings')
+    print(f'{"engine":>10} {"ms":>10} {"headings/s":>14}')
+    for name, compute in engines:
+        seconds = min(timeit.repeat(compute, number=1, repeat=repeat))
+        print(f'{name:>10} {seconds * 1e3:>10.2f} {len(levels) / seconds:>14,.0f}')
+    seconds = min(timeit.repeat(lambda: MarkdownParser().parse(raw_lines), number=1, repeat=repeat))
+    print(f'{"parse":>10} {seconds * 1e3:>10.2f} {len(levels) / seconds:>14,.0f}')
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
@@ -0,0 +1,30 @@
+import sys
+import tracemalloc
+
+from markdown_helper import MarkdownParser
+
+from benchmarks.generator import generate_document
+
+
+def measure(parse, lines):
+    tracemalloc.start()
+    try:
+        result = parse(lines)
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+
+def main(lines=50000):
+    lines = generate_document(lines=lines)
+    parser = MarkdownParser()
+    print(f'{len(lines)} lines')
+    for name, parse in (('objects', parser.parse), ('compact', parser.parse_compact)):
+        size = measure(parse, lines)
+        print(f'{name:>10} {size / len(lines):>8.1f} bytes/line')
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
@@ -0,0 +1,33 @@
+import os
+import sys
+import tempfile
+import timeit
+
+from markdown_helper import FileDescriptorSink, MarkdownHelper
+
+from benchmarks.generator import generate_document
+
+
+def main(lines=1000000, repeat=3):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'benchmark.md')
+        with open(path, 'w') as file:
+            file.writelines(f'{line}\n' for line in generate_document(lines=lines, heading_density=0.02, toc_blocks=1, with_anchors=True))
+        size = os.path.getsize(path)
+        fd = os.open(os.devnull, os.O_WRONLY)
+        try:
+            print(f'{lines} lines, {size / 1e6:.1f} MB')
+            print(f'{"command":>10} {"text MB/s":>12} {"mapped MB/s":>12}')
+            for command in ('cleanse', 'add_toc'):
+                speeds = []
+                for mapped in (False, True):
+                    md_helper = MarkdownHelper(path, mapped=mapped)
+                    seconds = min(timeit.repeat(lambda: getattr(md_helper, command)(sink=FileDescriptorSink(fd, encoding='utf-8')), number=1, repeat=repeat))
+                    speeds.append(size / seconds / 1e6)
+                print(f'{command:>10} {speeds[0]:>12.1f} {speeds[1]:>12.1f}')
+        finally:
+            os.close(fd)
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
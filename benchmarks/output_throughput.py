@@ -0,0 +1,58 @@
+import contextlib
+import os
+import sys
+import timeit
+import tracemalloc
+
+from markdown_helper import FileDescriptorSink, MarkdownDocument, StdoutSink
+
+from benchmarks.generator import generate_document
+
+
+def print_joined(content):
+    print('\n'.join(content))
+
+
+def print_lines(content):
+    for line in content:
+        print(line)
+
+
+def stdout_sink(content):
+    StdoutSink().write_lines(content)
+
+
+def measure(write, content, repeat=5):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        seconds = min(timeit.repeat(lambda: write(content), number=1, repeat=repeat))
+        tracemalloc.start()
+        try:
+            write(content)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return seconds, peak
+
+
+def main(lines=200000):
+    content = MarkdownDocument(generate_document(lines=lines)).dump(with_toc=True, max_main_toc_level=1, extra_sub_toc_level=2)
+    size = sum(len(line.encode()) + 1 for line in content)
+    fd = os.open(os.devnull, os.O_WRONLY)
+    try:
+        writers = (
+            ('joined', print_joined),
+            ('per line', print_lines),
+            ('stdout', stdout_sink),
+            ('fd', lambda content: FileDescriptorSink(fd, encoding='utf-8').write_lines(content)),
+        )
+        print(f'{len(content)} lines, {size / 1e6:.1f} MB')
+        print(f'{"writer":>10} {"MB/s":>10} {"peak KB":>10}')
+        for name, write in writers:
+            seconds, peak = measure(write, content)
+            print(f'{name:>10} {size / seconds / 1e6:>10.1f} {peak / 1e3:>10.0f}')
+    finally:
+        os.close(fd)
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
@@ -0,0 +1,46 @@
+import os
+import sys
+import timeit
+import tracemalloc
+
+from markdown_helper import FileDescriptorSink, MarkdownDocument
+
+from benchmarks.generator import generate_document
+
+
+def toc_sizes(content):
+    sizes = []
+    for line in content:
+        if line == MarkdownDocument.TOC_START:
+            sizes.append(0)
+        elif line.lstrip().startswith('* [') and sizes:
+            sizes[-1] += 1
+    return sizes
+
+
+def main(lines=200000, repeat=3):
+    raw_lines = generate_document(lines=lines, heading_density=0.25, depth_weights=(1, 10, 10, 10))
+    fd = os.open(os.devnull, os.O_WRONLY)
+    try:
+        print(f'{"max entries":>12} {"seconds":>10} {"lines":>10} {"main TOC":>10} {"largest":>10} {"sub TOCs":>10} {"peak KB":>10}')
+        for max_toc_entries in (0, 2000, 500, 100):
+            def render():
+                return list(MarkdownDocument.stream(lambda: iter(raw_lines), with_toc=True, max_toc_entries=max_toc_entries))
+
+            seconds = min(timeit.repeat(render, number=1, repeat=repeat))
+            content = render()
+            sizes = toc_sizes(content)
+            tracemalloc.start()
+            try:
+                FileDescriptorSink(fd, encoding='utf-8').write_lines(MarkdownDocument.stream(lambda: iter(raw_lines), with_toc=True, max_toc_entries=max_toc_entries))
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            assert not max_toc_entries or max(sizes) <= max_toc_entries, (max_toc_entries, max(sizes))
+            print(f'{max_toc_entries:>12} {seconds:>10.3f} {len(content):>10} {sizes[0]:>10} {max(sizes):>10} {len(sizes) - 1:>10} {peak / 1e3:>10.0f}')
+    finally:
+        os.close(fd)
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
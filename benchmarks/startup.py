@@ -0,0 +1,53 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+REG_IMPORT_TIME = re.compile('import time:\\s+\\d+ \\|\\s+(\\d+) \\| (\\S+)$')
+SMALL_DOCUMENT = os.path.join(os.path.dirname(__file__), '..', 'tests', 'resources', 'simple.md')
+SRC = os.path.join(os.path.dirname(__file__), '..', 'src')
+
+
+def _environment():
+    return dict(os.environ, PYTHONPATH=SRC)
+
+
+def import_time(module, repeat):
+    timings = []
+    for _ in range(repeat):
+        stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], env=_environment(), stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+        timings.append(next(int(match.group(1)) for match in map(REG_IMPORT_TIME.match, reversed(stderr.splitlines())) if match and match.group(2) == module))
+    return min(timings) / 1e6
+
+
+def run_time(module, args, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-m', module] + args, env=_environment(), stdout=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tracks mdh cold start time')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--budget', type=float, default=0.010, help='Maximum import time of the fast path in seconds')
+    args = parser.parse_args(argv)
+
+    toc_args = ['toc', '--no-cache', SMALL_DOCUMENT]
+    fast_import = import_time('markdownhelper.fast_cli', args.repeat)
+    print(f'{"import fast_cli":<20} {fast_import * 1000:>8.1f} ms (budget {args.budget * 1000:.1f} ms)')
+    print(f'{"import mdh_cli":<20} {import_time("markdownhelper.mdh_cli", args.repeat) * 1000:>8.1f} ms')
+    print(f'{"run fast_cli toc":<20} {run_time("markdownhelper.fast_cli", toc_args, args.repeat) * 1000:>8.1f} ms')
+    print(f'{"run mdh_cli toc":<20} {run_time("markdownhelper.mdh_cli", toc_args, args.repeat) * 1000:>8.1f} ms')
+    if fast_import > args.budget:
+        print('Import time of the fast path exceeds its budget', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
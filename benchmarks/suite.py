@@ -0,0 +1,93 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import timeit
+
+from markdown_helper import MarkdownDocument, MarkdownHelper, MarkdownParser
+
+from benchmarks.generator import generate_document
+
+CLI_MODES = {
+    'dump': lambda md_helper: md_helper.dump_content(),
+    'dump_debug': lambda md_helper: md_helper.dump_content(with_debug=True),
+    'cleanse': lambda md_helper: md_helper.cleanse_content(),
+    'toc': lambda md_helper: md_helper.add_toc_content(add_navigation=True, top_level=2, sub_level=2),
+    'toc_all_levels': lambda md_helper: md_helper.add_toc_content(add_navigation=True, top_level=0, sub_level=0),
+}
+
+
+def _best_of(function, repeat):
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def run_suite(lines, heading_density, toc_blocks, with_anchors, repeat=3, seed=0):
+    raw_lines = generate_document(lines=lines, heading_density=heading_density, toc_blocks=toc_blocks, with_anchors=with_anchors, seed=seed)
+    cleansed_lines = list(MarkdownDocument._cleansing_generator(raw_lines))
+    md_document = MarkdownDocument(cleansed_lines)
+    results = {
+        'parse': _best_of(lambda: MarkdownParser().parse(cleansed_lines), repeat),
+        'parse_compact': _best_of(lambda: MarkdownParser().parse_compact(cleansed_lines), repeat),
+        'cleansing_generator': _best_of(lambda: list(MarkdownDocument._cleansing_generator(raw_lines)), repeat),
+        'create_toc': _best_of(lambda: md_document._create_toc((), 0, 0), repeat),
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'benchmark.md')
+        with open(path, 'w') as file:
+            file.writelines(f'{line}\n' for line in raw_lines)
+        for mode, render in CLI_MODES.items():
+            results[f'mdh_{mode}'] = _best_of(lambda: list(render(MarkdownHelper(path))), repeat)
+    return results
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, seconds in sorted(results.items()):
+        if name in baseline:
+            ratio = seconds / baseline[name]
+            status = 'REGRESSION' if ratio > 1 + threshold else 'ok'
+            if status != 'ok':
+                regressions.append(name)
+            print(f'{name:<22} {baseline[name]:>10.4f} {seconds:>10.4f} {ratio:>7.2f}x {status}')
+        else:
+            print(f'{name:<22} {"-":>10} {seconds:>10.4f} {"":>8} new')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Times mdh stages on a synthetic markdown document')
+    parser.add_argument('--lines', type=int, default=50000)
+    parser.add_argument('--heading-density', type=float, default=0.1)
+    parser.add_argument('--toc-blocks', type=int, default=10)
+    parser.add_argument('--with-anchors', action='store_true')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='Writes results to this JSON file')
+    parser.add_argument('--baseline', help='Compares results against this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Allowed slowdown against the baseline, 0.25 means 25%%')
+    args = parser.parse_args(argv)
+
+    parameters = dict(lines=args.lines, heading_density=args.heading_density, toc_blocks=args.toc_blocks, with_anchors=args.with_anchors)
+    results = run_suite(repeat=args.repeat, **parameters)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(dict(python=platform.python_version(), parameters=parameters, results=results), file, indent=2, sort_keys=True)
+    if not args.baseline:
+        for name, seconds in sorted(results.items()):
+            print(f'{name:<22} {seconds:>10.4f}')
+        return 0
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    if baseline['parameters'] != parameters:
+        print(f'Baseline was recorded with different parameters: {baseline["parameters"]}', file=sys.stderr)
+        return 2
+    regressions = compare(results, baseline['results'], args.threshold)
+    if regressions:
+        print(f'{len(regressions)} regressions: {", ".join(regressions)}', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
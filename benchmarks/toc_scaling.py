@@ -0,0 +1,23 @@
+import sys
+import timeit
+
+from markdown_helper import MarkdownDocument
+
+from benchmarks.generator import generate_document
+
+
+def time_toc(lines, repeat=3):
+    md_document = MarkdownDocument(generate_document(lines=lines, heading_density=0.5, depth_weights=(1, 3, 3)))
+    return min(timeit.repeat(lambda: md_document.dump(with_toc=True, max_main_toc_level=1, extra_sub_toc_level=2), number=1, repeat=repeat))
+
+
+def main(base_lines=4000, steps=4):
+    print(f'{"lines":>10} {"seconds":>10} {"us/line":>10}')
+    for step in range(steps):
+        lines = base_lines * 2 ** step
+        seconds = time_toc(lines)
+        print(f'{lines:>10} {seconds:>10.4f} {seconds / lines * 1e6:>10.2f}')
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
@@ -68,5 +68,5 @@ setup(
     package_dir={"": "src"},
     test_suite="tests",
     tests_require=test_requirements,
-    entry_points={"console_scripts": ["mdh=markdownhelper.mdh_cli:mdh"]},
+    entry_points={"console_scripts": ["mdh=markdownhelper.fast_cli:main"]},
 )
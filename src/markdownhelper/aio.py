@@ -0,0 +1,126 @@
+import asyncio
+import codecs
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from .batch import CHANGED, ERROR, UNCHANGED, FileResult
+from .markdown_helper import InvalidTocError, MarkdownDocument, MarkdownHelper
+
+OFFLOAD_THRESHOLD = 5000
+CHUNK_LINES = 2048
+
+
+class _LinesHelper(MarkdownHelper):
+
+    def __init__(self, lines):
+        super().__init__(path=None)
+        self.lines = lines
+
+    def _stream(self, mapped=False, **kwargs):
+        return MarkdownDocument.stream(lambda: iter(self.lines), **kwargs)
+
+
+def iter_content(lines, command, options):
+    return getattr(_LinesHelper(lines), f'{command}_content')(**options)
+
+
+def render(lines, command, options):
+    return list(iter_content(lines, command, options))
+
+
+def _read_file(path):
+    return list(MarkdownHelper._read_from_file(path))
+
+
+def _is_path(source):
+    return isinstance(source, (str, os.PathLike))
+
+
+async def iter_lines(stream, encoding='utf-8'):
+    decoder = None
+    empty = ''
+    pending = ''
+    async for chunk in stream:
+        if decoder is None:
+            empty = b'' if isinstance(chunk, bytes) else ''
+            decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(encoding)() if empty == b'' else None, translate=True)
+        *lines, pending = (pending + decoder.decode(chunk)).split('\n')
+        for line in lines:
+            yield line
+    if decoder is not None:
+        *lines, pending = (pending + decoder.decode(empty, final=True)).split('\n')
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+
+class AsyncMarkdownHelper:
+
+    def __init__(self, executor=None, offload_threshold=OFFLOAD_THRESHOLD, encoding='utf-8'):
+        self.executor = executor
+        self.offload_threshold = offload_threshold
+        self.encoding = encoding
+
+    async def read_lines(self, source):
+        if _is_path(source):
+            return await asyncio.get_running_loop().run_in_executor(None, _read_file, source)
+        return [line async for line in iter_lines(source, self.encoding)]
+
+    def _should_offload(self, lines):
+        return len(lines) >= self.offload_threshold
+
+    async def _offload(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def _render(self, lines, command, options):
+        if not self._should_offload(lines):
+            return render(lines, command, options)
+        return await self._offload(render, lines, command, options)
+
+    async def render(self, source, command, options):
+        return await self._render(await self.read_lines(source), command, options)
+
+    async def stream(self, source, command, options):
+        lines = await self.read_lines(source)
+        if not self._should_offload(lines) or isinstance(self.executor, ProcessPoolExecutor):
+            for line in await self._render(lines, command, options):
+                yield line
+            return
+        content = await self._offload(iter_content, lines, command, options)
+        chunk = await self._offload(list, islice(content, CHUNK_LINES))
+        while chunk:
+            for line in chunk:
+                yield line
+            chunk = await self._offload(list, islice(content, CHUNK_LINES))
+
+    async def process(self, source, command, options):
+        name = os.fspath(source) if _is_path(source) else getattr(source, 'name', None)
+        try:
+            lines = await self.read_lines(source)
+            content = await self._render(lines, command, options)
+        except (OSError, UnicodeDecodeError, InvalidTocError) as e:
+            return FileResult(name, ERROR, None, str(e))
+        return FileResult(name, CHANGED if content != lines else UNCHANGED, content, None)
+
+    async def dump(self, source, add_toc=False, remove_old_toc=False, with_debug=False):
+        return await self.render(source, 'dump', dict(add_toc=add_toc, remove_old_toc=remove_old_toc, with_debug=with_debug))
+
+    async def cleanse(self, source):
+        return await self.render(source, 'cleanse', dict())
+
+    async def add_toc(self, source, add_navigation=False, top_level=0, sub_level=0, max_toc_entries=0):
+        return await self.render(source, 'add_toc', dict(add_navigation=add_navigation, top_level=top_level, sub_level=sub_level, max_toc_entries=max_toc_entries))
+
+
+async def process_many(sources, command, options, concurrency=8, executor=None, offload_threshold=OFFLOAD_THRESHOLD):
+    helper = AsyncMarkdownHelper(executor, offload_threshold)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def process(source):
+        async with semaphore:
+            return await helper.process(source, command, options)
+
+    return await asyncio.gather(*(process(source) for source in sources))
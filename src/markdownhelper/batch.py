@@ -0,0 +1,131 @@
+import glob
+import os
+import time
+from collections import namedtuple
+from functools import partial
+
+from .markdown_helper import InvalidTocError, MarkdownHelper, Metrics, collect_metrics
+
+MARKDOWN_SUFFIXES = ('.md', '.markdown')
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+ERROR = 'error'
+PRINT = 'print'
+IN_PLACE = 'in_place'
+CHECK = 'check'
+DIFF = 'diff'
+
+FileResult = namedtuple('FileResult', ['path', 'status', 'content', 'error', 'metrics'], defaults=(None,))
+
+
+def is_glob(path):
+    return glob.escape(path) != path and not os.path.exists(path)
+
+
+def _walk_markdown_files(directory):
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for file in sorted(files):
+            if file.endswith(MARKDOWN_SUFFIXES):
+                yield os.path.join(root, file)
+
+
+def expand_paths(paths):
+    seen = set()
+    for path in paths:
+        candidates = sorted(glob.glob(path, recursive=True)) or [path] if is_glob(path) else [path]
+        for candidate in candidates:
+            files = _walk_markdown_files(candidate) if os.path.isdir(candidate) else [candidate]
+            for file in files:
+                if file not in seen:
+                    seen.add(file)
+                    yield file
+
+
+def read_path_list(lines):
+    return [line.rstrip('\r\n') for line in lines if line.strip()]
+
+
+def git_changed_paths(ref, cwd=None):
+    import subprocess
+    toplevel = subprocess.run(['git', 'rev-parse', '--show-toplevel'], cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True).stdout.strip()
+    names = subprocess.run(['git', 'diff', '--name-only', '-z', '--diff-filter=d', ref, '--'], cwd=toplevel, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                           universal_newlines=True, check=True).stdout
+    return [os.path.relpath(os.path.join(toplevel, name)) for name in names.split('\0') if name]
+
+
+def select_markdown_files(candidates, paths=()):
+    allowed = {os.path.abspath(path) for path in expand_paths(paths)} if paths else None
+    for candidate in candidates:
+        if candidate.endswith(MARKDOWN_SUFFIXES) and os.path.isfile(candidate) and (allowed is None or os.path.abspath(candidate) in allowed):
+            yield candidate
+
+
+def process_file(path, command, options, mode=PRINT, cache=None, profile=False):
+    if not profile:
+        return _process_file(path, command, options, mode, cache)
+    with collect_metrics() as metrics:
+        result = _process_file(path, command, options, mode, cache)
+    return result._replace(metrics=metrics.as_dict())
+
+
+def _process_file(path, command, options, mode, cache):
+    try:
+        md_helper = MarkdownHelper(path, cache=cache)
+        if mode == DIFF:
+            from .toc_diff import TocDiff
+            toc_diff = TocDiff(list(md_helper._read_from_file(path)), **options)
+            return FileResult(path, CHANGED if toc_diff.hunks else UNCHANGED, toc_diff.unified_diff(path), None)
+        content = getattr(md_helper, f'{command}_content')(**options, mapped=mode != PRINT and md_helper._should_map())
+        if mode == IN_PLACE:
+            return FileResult(path, CHANGED if md_helper.write_content(content) else UNCHANGED, None, None)
+        if mode == CHECK:
+            return FileResult(path, CHANGED if md_helper.is_changed(content) else UNCHANGED, None, None)
+        content = list(content)
+        return FileResult(path, CHANGED if md_helper.is_changed(content) else UNCHANGED, content, None)
+    except (OSError, UnicodeDecodeError, InvalidTocError) as e:
+        return FileResult(path, ERROR, None, str(e))
+
+
+def process_files(paths, command, options, jobs=1, mode=PRINT, cache=None, profile=False):
+    worker = partial(process_file, command=command, options=options, mode=mode, cache=cache, profile=profile)
+    if jobs > 1 and len(paths) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            yield from executor.map(worker, paths, chunksize=max(1, len(paths) // (jobs * 4)))
+    else:
+        yield from map(worker, paths)
+
+
+class BatchRun:
+
+    def __init__(self, command, options, jobs=1, mode=PRINT, cache=None, profile=False):
+        self.command = command
+        self.options = options
+        self.jobs = jobs
+        self.mode = mode
+        self.cache = cache
+        self.metrics = Metrics() if profile else None
+        self.results = []
+        self.elapsed = 0
+
+    def run(self, paths):
+        start = time.perf_counter()
+        for result in process_files(list(expand_paths(paths)), self.command, self.options, self.jobs, self.mode, self.cache, self.metrics is not None):
+            self.results.append(result)
+            if result.metrics:
+                self.metrics.merge(result.metrics)
+            yield result
+        self.elapsed = time.perf_counter() - start
+
+    def count(self, status):
+        return sum(1 for result in self.results if result.status == status)
+
+    def as_dict(self):
+        return dict(files=[dict(path=result.path, status=result.status, error=result.error) for result in self.results],
+                    changed=self.count(CHANGED), unchanged=self.count(UNCHANGED), errors=self.count(ERROR), elapsed=self.elapsed)
+
+    def summary(self):
+        lines = [f'{result.status:<10} {result.path}{": " + result.error if result.error else ""}' for result in self.results]
+        lines.append(f'{len(self.results)} files ({self.count(CHANGED)} changed, {self.count(UNCHANGED)} unchanged, {self.count(ERROR)} errors) in {self.elapsed:.2f}s')
+        return lines
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import tempfile
+from functools import partial
+
+from . import __version__
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+READ_CHUNK_SIZE = 1 << 20
+
+
+def default_cache_dir():
+    if 'MDH_CACHE_DIR' in os.environ:
+        return os.environ['MDH_CACHE_DIR']
+    return os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser(os.path.join('~', '.cache'))), 'mdh')
+
+
+class ResultCache:
+
+    def __init__(self, directory=None, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory or default_cache_dir()
+        self.max_size = max_size
+        self._size = None
+
+    @staticmethod
+    def _options_digest(options):
+        digest = hashlib.sha256()
+        digest.update(json.dumps([__version__, options], sort_keys=True).encode())
+        return digest
+
+    @staticmethod
+    def key(raw_bytes, options):
+        digest = ResultCache._options_digest(options)
+        digest.update(raw_bytes)
+        return digest.hexdigest()
+
+    @staticmethod
+    def file_key(path, options):
+        digest = ResultCache._options_digest(options)
+        with open(path, 'rb') as file:
+            for chunk in iter(partial(file.read, READ_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key)
+
+    def _entries(self):
+        try:
+            with os.scandir(self.directory) as entries:
+                return [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries if entry.is_file() and not entry.name.startswith('.')]
+        except FileNotFoundError:
+            return []
+
+    def get(self, key):
+        lines = self.iter_lines(key)
+        return None if lines is None else list(lines)
+
+    def iter_lines(self, key):
+        path = self._entry_path(key)
+        try:
+            file = open(path, encoding='utf-8', errors='surrogateescape', newline='\n')
+            os.utime(path)
+        except OSError:
+            return None
+        return self._read_lines(file)
+
+    @staticmethod
+    def _read_lines(file):
+        with file:
+            for line in file:
+                yield line[:-1]
+
+    def put(self, key, content):
+        for _ in self.put_lines(key, content):
+            pass
+
+    def put_lines(self, key, lines):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.')
+        except OSError:
+            yield from lines
+            return
+        file = os.fdopen(fd, 'wb')
+        size = 0
+        try:
+            for line in lines:
+                if file is not None:
+                    data = f'{line}\n'.encode('utf-8', errors='surrogateescape') if line.__class__ is str else line.data
+                    size += len(data)
+                    file = self._write(file, data)
+                yield line
+            if file is None or not self._commit(file, temp_path, key):
+                return
+        finally:
+            if file is not None:
+                file.close()
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+        self._add_size(size)
+
+    @staticmethod
+    def _write(file, data):
+        try:
+            file.write(data)
+        except OSError:
+            file.close()
+            return None
+        return file
+
+    def _commit(self, file, temp_path, key):
+        try:
+            file.close()
+            os.replace(temp_path, self._entry_path(key))
+        except OSError:
+            return False
+        return True
+
+    def _add_size(self, size):
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        else:
+            self._size += size
+        if self._size > self.max_size:
+            self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._size <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+
+    def clear(self):
+        entries = self._entries()
+        for _, _, path in entries:
+            os.unlink(path)
+        self._size = 0
+        return len(entries)
@@ -0,0 +1,149 @@
+import os
+import sys
+
+from .batch import CHANGED, CHECK, ERROR, IN_PLACE, PRINT, BatchRun, is_glob
+from .markdown_helper import InvalidTocError, MarkdownHelper, collect_metrics
+
+FAST_PATH_OPTIONS = {
+    'toc': {
+        '--top-level': ('top_level', int),
+        '--sub-level': ('sub_level', int),
+        '--navigation': ('navigation', True),
+        '--bbbno-navigation': ('navigation', False),
+        '--max-toc-entries': ('max_toc_entries', int),
+        '--cache': ('cache', True),
+        '--no-cache': ('cache', False),
+        '--in-place': ('in_place', True),
+        '--check': ('check', True),
+    },
+    'cleanse': {
+        '--in-place': ('in_place', True),
+        '--check': ('check', True),
+    },
+}
+FAST_PATH_DEFAULTS = {
+    'toc': dict(top_level=2, sub_level=2, navigation=True, max_toc_entries=0, cache=True, in_place=False, check=False),
+    'cleanse': dict(in_place=False, check=False),
+}
+
+
+def is_single_file(paths, jobs):
+    return len(paths) == 1 and jobs == 1 and not is_glob(paths[0]) and not os.path.isdir(paths[0])
+
+
+def _print_metrics(metrics, profile):
+    if profile == 'json':
+        import json
+        print(json.dumps(metrics.as_dict(), sort_keys=True), file=sys.stderr)
+    else:
+        for line in metrics.report():
+            print(line, file=sys.stderr)
+
+
+def run(paths, jobs, command, options, mode=PRINT, cache=None, profile=None, summary_format='text'):
+    if mode == PRINT and summary_format == 'text' and is_single_file(paths, jobs):
+        if profile:
+            with collect_metrics() as metrics:
+                exit_code = run(paths, jobs, command, options, mode, cache)
+            _print_metrics(metrics, profile)
+            return exit_code
+        try:
+            getattr(MarkdownHelper(path=paths[0], cache=cache), command)(**options)
+        except InvalidTocError as e:
+            print(f'Error: {paths[0]}: {e}', file=sys.stderr)
+            return 1
+        return 0
+    batch_run = BatchRun(command, options, jobs, mode, cache, profile is not None)
+    for result in batch_run.run(paths):
+        if result.content is not None and batch_run.metrics is not None:
+            with collect_metrics(batch_run.metrics):
+                MarkdownHelper._print_content(result.content)
+        elif result.content is not None:
+            MarkdownHelper._print_content(result.content)
+    if summary_format == 'json':
+        import json
+        print(json.dumps(batch_run.as_dict(), sort_keys=True), file=sys.stderr)
+    else:
+        for line in batch_run.summary():
+            print(line, file=sys.stderr)
+    if profile:
+        _print_metrics(batch_run.metrics, profile)
+    return 1 if batch_run.count(ERROR) or (mode == CHECK and batch_run.count(CHANGED)) else 0
+
+
+def _parse_fast_path(args):
+    if not args or args[0] not in FAST_PATH_OPTIONS:
+        return None
+    command, known_options = args[0], FAST_PATH_OPTIONS[args[0]]
+    values = dict(FAST_PATH_DEFAULTS[command])
+    paths = []
+    remaining = iter(args[1:])
+    for arg in remaining:
+        name, _, inline_value = arg.partition('=')
+        if name in known_options:
+            key, value = known_options[name]
+            if value is int:
+                raw_value = inline_value or next(remaining, None)
+                if raw_value is None or not raw_value.lstrip('-').isdigit():
+                    return None
+                value = int(raw_value)
+            elif inline_value:
+                return None
+            values[key] = value
+        elif arg.startswith('-'):
+            return None
+        else:
+            paths.append(arg)
+    if len(paths) != 1 or not os.path.isfile(paths[0]) or (values['in_place'] and values['check']) or values.get('max_toc_entries', 0) < 0 or values.get('max_toc_entries') == 1:
+        return None
+    return command, paths, values
+
+
+def _run_fast_path(command, paths, values):
+    mode = IN_PLACE if values['in_place'] else CHECK if values['check'] else PRINT
+    if command == 'cleanse':
+        return run(paths, 1, 'cleanse', dict(), mode)
+    cache = None
+    if values['cache']:
+        from .cache import ResultCache
+        cache = ResultCache()
+    return run(paths, 1, 'add_toc', dict(add_navigation=values['navigation'], top_level=values['top_level'], sub_level=values['sub_level'], max_toc_entries=values['max_toc_entries']), mode, cache)
+
+
+def client(args, socket_path=None):
+    parsed = _parse_fast_path(args)
+    if parsed is None or parsed[2]['in_place'] or parsed[2]['check']:
+        print('Usage: mdh client toc|cleanse [OPTIONS] PATH', file=sys.stderr)
+        return 2
+    command, paths, values = parsed
+    from .server import ServerError, ServerUnavailable, UnsafeSocketError, call
+    params = dict(path=os.path.abspath(paths[0]))
+    if command == 'toc':
+        params.update(add_navigation=values['navigation'], top_level=values['top_level'], sub_level=values['sub_level'], max_toc_entries=values['max_toc_entries'])
+    try:
+        content = call('add_toc' if command == 'toc' else 'cleanse', params, socket_path)
+    except ServerUnavailable:
+        return _run_fast_path(*parsed)
+    except ServerError as e:
+        print(f'Error: {paths[0]}: {e}', file=sys.stderr)
+        return 1
+    except UnsafeSocketError as e:
+        print(f'Error: {e}', file=sys.stderr)
+        return 1
+    MarkdownHelper._print_content(content)
+    return 0
+
+
+def main(args=None):
+    args = sys.argv[1:] if args is None else args
+    if args and args[0] == 'client':
+        return client(args[1:])
+    parsed = _parse_fast_path(args)
+    if parsed is None:
+        from .mdh_cli import mdh
+        return mdh(args=args)
+    return _run_fast_path(*parsed)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
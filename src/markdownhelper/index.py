@@ -0,0 +1,150 @@
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+from collections import namedtuple
+from urllib.parse import quote
+
+from . import __version__
+from .batch import ERROR, expand_paths
+from .markdown_helper import InvalidTocError, MarkdownDocument, MarkdownHeading, MarkdownHelper, StreamSink
+
+DEFAULT_OUTPUT = 'INDEX.md'
+INDEX_FILE_NAME = '.mdh_index.json'
+INDEX_TITLE = '# Index'
+PARSED = 'parsed'
+REUSED = 'reused'
+REMOVED = 'removed'
+
+IndexEntry = namedtuple('IndexEntry', ['mtime_ns', 'size', 'digest', 'headings'])
+IndexResult = namedtuple('IndexResult', ['path', 'status', 'entry', 'error'])
+
+
+def index_document(path, entry=None):
+    try:
+        stat = os.stat(path)
+        with open(path, 'rb') as file:
+            data = file.read()
+        digest = hashlib.sha256(data).hexdigest()
+        if entry is not None and entry.digest == digest:
+            return IndexResult(path, REUSED, entry._replace(mtime_ns=stat.st_mtime_ns, size=stat.st_size), None)
+        md_document = MarkdownDocument((line.rstrip('\n') for line in io.TextIOWrapper(io.BytesIO(data))), remove_old_toc=True)
+        headings = [(heading.heading_level, heading.text_after_heading, heading.heading_indices.current) for heading in md_document.md_lines.iter_headings()]
+    except (OSError, UnicodeDecodeError, InvalidTocError) as e:
+        return IndexResult(path, ERROR, None, str(e))
+    return IndexResult(path, PARSED, IndexEntry(stat.st_mtime_ns, stat.st_size, digest, headings), None)
+
+
+def _is_fresh(path, entry):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    return stat.st_mtime_ns == entry.mtime_ns and stat.st_size == entry.size
+
+
+def index_documents(paths_and_entries, jobs=1):
+    if jobs > 1 and len(paths_and_entries) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            yield from executor.map(index_document, *zip(*paths_and_entries), chunksize=max(1, len(paths_and_entries) // (jobs * 4)))
+    else:
+        yield from (index_document(path, entry) for path, entry in paths_and_entries)
+
+
+class DocumentIndex:
+
+    def __init__(self, output=DEFAULT_OUTPUT, index_file=None, top_level=0, jobs=1, toc_top_level=0, toc_sub_level=0):
+        self.output = output
+        self.index_file = index_file or os.path.join(os.path.dirname(output), INDEX_FILE_NAME)
+        self.top_level = top_level
+        self.jobs = jobs
+        self.toc_top_level = toc_top_level
+        self.toc_sub_level = toc_sub_level
+        self.base = os.path.dirname(os.path.abspath(output))
+        self.entries = {}
+        self.results = []
+        self.changed = False
+        self.elapsed = 0
+
+    def name(self, path):
+        return os.path.relpath(os.path.abspath(path), self.base).replace(os.sep, '/')
+
+    def load(self):
+        try:
+            with open(self.index_file, encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get('version') != __version__:
+            return {}
+        return {name: IndexEntry(mtime_ns, size, digest, [(level, text, tuple(path)) for level, text, path in headings])
+                for name, (mtime_ns, size, digest, headings) in data.get('documents', {}).items()}
+
+    def save(self):
+        data = json.dumps(dict(version=__version__, documents=self.entries), ensure_ascii=False).encode('utf-8')
+        directory = os.path.dirname(os.path.abspath(self.index_file))
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.mdh-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, self.index_file)
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+    def update(self, paths):
+        start = time.perf_counter()
+        previous = self.load()
+        excluded = {os.path.abspath(self.output), os.path.abspath(self.index_file)}
+        paths = {self.name(path): path for path in expand_paths(paths) if os.path.abspath(path) not in excluded}
+        pending = []
+        for name, path in paths.items():
+            entry = previous.get(name)
+            if entry is not None and _is_fresh(path, entry):
+                self.entries[name] = entry
+                self.results.append(IndexResult(path, REUSED, entry, None))
+            else:
+                self.entries[name] = None
+                pending.append((path, entry))
+        for result in index_documents(pending, self.jobs):
+            self.entries[self.name(result.path)] = result.entry
+            self.results.append(result)
+        self.entries = {name: entry for name, entry in self.entries.items() if entry is not None}
+        self.results.extend(IndexResult(name, REMOVED, None, None) for name in previous if name not in paths)
+        self.save()
+        self.changed = self.write()
+        self.elapsed = time.perf_counter() - start
+        return self.changed
+
+    def is_anchored(self, level):
+        return not self.toc_top_level or level <= self.toc_top_level + self.toc_sub_level
+
+    def toc_lines(self):
+        yield INDEX_TITLE
+        yield ''
+        for name, entry in self.entries.items():
+            target = quote(name)
+            yield f'* [{name}]({target})'
+            for level, text, path in entry.headings:
+                if (not self.top_level or level <= self.top_level) and self.is_anchored(level):
+                    yield f'{"  " * level}* [{text}]({target}#{MarkdownHeading._anchor_name(path)})'
+
+    def write(self):
+        if os.path.exists(self.output):
+            return MarkdownHelper(self.output).write_content(self.toc_lines())
+        with open(self.output, 'wb') as file:
+            MarkdownHelper._print_content(self.toc_lines(), StreamSink(file))
+        return True
+
+    def count(self, status):
+        return sum(1 for result in self.results if result.status == status)
+
+    def summary(self):
+        lines = [f'{result.status:<10} {result.path}{": " + result.error if result.error else ""}' for result in self.results]
+        lines.append(f'{len(self.entries)} files ({self.count(PARSED)} parsed, {self.count(REUSED)} reused, {self.count(REMOVED)} removed, {self.count(ERROR)} errors) in {self.elapsed:.2f}s')
+        lines.append(f'{self.output} {"updated" if self.changed else "unchanged"}')
+        return lines
@@ -1,10 +1,138 @@
+import os
 import re
+import sys
+from array import array
+from bisect import bisect_left
 from collections import namedtuple
+from contextlib import contextmanager
+from itertools import islice
+from time import perf_counter
 
 HeadingIndices = namedtuple('HeadingIndices', ['previous', 'current', 'next'])
+TocPage = namedtuple('TocPage', ['depth', 'base_level', 'entries'])
+
+
+class InvalidTocError(ValueError):
+    pass
+
+
+class Metrics:
+    STAGES = ('read', 'remove_tocs', 'cleanse', 'parse', 'index', 'create_toc', 'render', 'output')
+
+    def __init__(self):
+        self.timings = {}
+        self.counters = {}
+        self.counting = True
+        self._stack = []
+
+    def count(self, name, value=1):
+        if self.counting:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def uncounted(self):
+        counting, self.counting = self.counting, False
+        try:
+            yield
+        finally:
+            self.counting = counting
+
+    def enter(self, name):
+        now = perf_counter()
+        if self._stack:
+            parent, started = self._stack[-1]
+            self.timings[parent] = self.timings.get(parent, 0) + now - started
+        self._stack.append((name, now))
+
+    def exit(self):
+        now = perf_counter()
+        name, started = self._stack.pop()
+        self.timings[name] = self.timings.get(name, 0) + now - started
+        if self._stack:
+            self._stack[-1] = (self._stack[-1][0], now)
+
+    def merge(self, other):
+        other = other if isinstance(other, dict) else other.as_dict()
+        for name, seconds in other['timings'].items():
+            self.timings[name] = self.timings.get(name, 0) + seconds
+        for name, value in other['counters'].items():
+            self.count(name, value)
+
+    def as_dict(self):
+        return dict(timings=dict(self.timings), counters=dict(self.counters))
+
+    def report(self):
+        total = sum(self.timings.values()) or 1
+        lines = [f'{"stage":<12} {"seconds":>10} {"share":>7}']
+        for name in sorted(self.timings, key=lambda name: self.STAGES.index(name) if name in self.STAGES else len(self.STAGES)):
+            lines.append(f'{name:<12} {self.timings[name]:>10.4f} {self.timings[name] / total:>7.1%}')
+        lines.append(f'{"total":<12} {sum(self.timings.values()):>10.4f}')
+        lines.extend(f'{name:<12} {value:>10}' for name, value in sorted(self.counters.items()))
+        return lines
+
+
+class _Stage:
+    __slots__ = ('metrics', 'name')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.metrics.enter(self.name)
+
+    def __exit__(self, *exc_info):
+        self.metrics.exit()
+
+
+class _NoStage:
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_STAGE = _NoStage()
+_metrics = None
+
+
+@contextmanager
+def collect_metrics(metrics=None):
+    global _metrics
+    previous, _metrics = _metrics, metrics if metrics is not None else Metrics()
+    try:
+        yield _metrics
+    finally:
+        _metrics = previous
+
+
+def _stage(name):
+    return _NO_STAGE if _metrics is None else _Stage(_metrics, name)
+
+
+def _profiled(name, iterable, counter=None):
+    return iterable if _metrics is None else _profiled_generator(_metrics, name, iterable, counter)
+
+
+def _profiled_generator(metrics, name, iterable, counter):
+    iterator = iter(iterable)
+    while True:
+        metrics.enter(name)
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            metrics.exit()
+        if counter:
+            metrics.count(counter)
+        yield item
 
 
 class MarkdownLine:
+    __slots__ = ('raw_text',)
 
     def __init__(self, text):
         self.raw_text = text
@@ -20,6 +148,8 @@ class MarkdownLine:
 
 
 class MarkdownHeading(MarkdownLine):
+    __slots__ = ('heading', 'text_after_heading', 'heading_level', 'heading_indices')
+
     def __init__(self, text):
         super().__init__(text)
         self.heading, _, self.text_after_heading = text.partition(" ")
@@ -60,11 +190,284 @@ class MarkdownHeading(MarkdownLine):
         return result
 
 
+class HeadingIndex:
+    __slots__ = ('parents', 'counters', '_paths')
+    NUMPY_THRESHOLD = 4096
+
+    def __init__(self, levels):
+        numpy = _import_numpy() if len(levels) >= self.NUMPY_THRESHOLD else None
+        self.parents, self.counters = self._compute_with_numpy(numpy, levels) if numpy is not None else self._compute(levels)
+        self._paths = [None] * len(levels)
+
+    @staticmethod
+    def _compute(levels):
+        parents, counters = array('l'), array('l')
+        stack = []
+        for heading_number, level in enumerate(levels):
+            if level > len(stack):
+                parents.append(stack[-1] if stack else -1)
+                counters.append(1)
+                stack.append(heading_number)
+            else:
+                del stack[level:]
+                sibling = stack[-1]
+                parents.append(parents[sibling])
+                counters.append(counters[sibling] + 1)
+                stack[-1] = heading_number
+        return parents, counters
+
+    @staticmethod
+    def _compute_with_numpy(numpy, levels):
+        levels = numpy.asarray(levels, dtype=numpy.int64)
+        heading_numbers = numpy.arange(len(levels))
+        # a heading is at most one level deeper than its predecessor: depth = min(level, previous depth + 1)
+        depths = heading_numbers + numpy.minimum.accumulate(numpy.minimum(levels - heading_numbers, 1))
+        parents = numpy.full(len(levels), -1)
+        counters = numpy.zeros(len(levels), dtype=numpy.int64)
+        for depth in range(1, int(depths.max()) + 1):
+            at_depth = depths == depth
+            last_shallower = numpy.maximum.accumulate(numpy.where(depths < depth, heading_numbers, -1))
+            depth_parents = numpy.concatenate(([-1], last_shallower[:-1]))[at_depth]
+            seen = numpy.cumsum(at_depth)
+            parents[at_depth] = depth_parents
+            counters[at_depth] = seen[at_depth] - numpy.where(depth_parents >= 0, seen[depth_parents], 0)
+        return array('l', parents.tolist()), array('l', counters.tolist())
+
+    def __len__(self):
+        return len(self.counters)
+
+    def __getitem__(self, heading_number):
+        path = self._paths[heading_number]
+        if path is None:
+            parent = self.parents[heading_number]
+            path = (*self[parent], self.counters[heading_number]) if parent >= 0 else (self.counters[heading_number],)
+            self._paths[heading_number] = path
+        return path
+
+    def __iter__(self):
+        return (self[heading_number] for heading_number in range(len(self)))
+
+
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class MarkdownLineStore:
+    __slots__ = ('raw_lines', 'heading_positions', 'heading_levels', 'heading_paths', '_headings')
+
+    def __init__(self, raw_lines, heading_positions, heading_levels, heading_paths, headings=None):
+        self.raw_lines = raw_lines
+        self.heading_positions = heading_positions
+        self.heading_levels = heading_levels
+        self.heading_paths = heading_paths
+        self._headings = headings if headings is not None else [None] * len(heading_positions)
+
+    @classmethod
+    def from_md_lines(cls, md_lines):
+        raw_lines, heading_positions, heading_levels, heading_paths, headings = [], array('l'), array('l'), [], []
+        for position, md_line in enumerate(md_lines):
+            raw_lines.append(md_line.raw_text)
+            if isinstance(md_line, MarkdownHeading):
+                heading_positions.append(position)
+                heading_levels.append(md_line.heading_level)
+                heading_paths.append(md_line.heading_indices.current)
+                headings.append(md_line)
+        return cls(raw_lines, heading_positions, heading_levels, heading_paths, headings)
+
+    def __len__(self):
+        return len(self.raw_lines)
+
+    def __getitem__(self, position):
+        heading_number = bisect_left(self.heading_positions, position)
+        if heading_number < len(self.heading_positions) and self.heading_positions[heading_number] == position:
+            return self.heading(heading_number)
+        return MarkdownLine(self.raw_lines[position])
+
+    def __iter__(self):
+        for md_line in self.iter_compact():
+            yield md_line if isinstance(md_line, MarkdownHeading) else MarkdownLine(md_line)
+
+    def heading(self, heading_number):
+        heading = self._headings[heading_number]
+        if heading is None:
+            paths = self.heading_paths
+            heading = MarkdownHeading(self.raw_lines[self.heading_positions[heading_number]])
+            heading.heading_indices = HeadingIndices(paths[heading_number - 1] if heading_number > 0 else (),
+                                                     paths[heading_number],
+                                                     paths[heading_number + 1] if heading_number + 1 < len(paths) else ())
+            self._headings[heading_number] = heading
+        return heading
+
+    def iter_headings(self):
+        return (self.heading(heading_number) for heading_number in range(len(self.heading_positions)))
+
+    def iter_compact(self):
+        start = 0
+        for heading_number, position in enumerate(self.heading_positions):
+            yield from self.raw_lines[start:position]
+            yield self.heading(heading_number)
+            start = position + 1
+        yield from self.raw_lines[start:]
+
+
+class RawLines:
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __contains__(self, text):
+        return False
+
+    def __len__(self):
+        return len(self.data)
+
+
+class BlockScanner:
+    TEXT = 'text'
+    BLANK = 'blank'
+    HEADING = 'heading'
+    FENCE = 'fence'
+    CODE = 'code'
+    HTML = 'html'
+
+    HTML_RAW_TAGS = ('script', 'pre', 'style', 'textarea')
+    HTML_BLOCK_TAGS = frozenset((
+        'address', 'article', 'aside', 'base', 'basefont', 'blockquote', 'body', 'caption', 'center', 'col', 'colgroup', 'dd', 'details', 'dialog',
+        'dir', 'div', 'dl', 'dt', 'fieldset', 'figcaption', 'figure', 'footer', 'form', 'frame', 'frameset', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+        'head', 'header', 'hr', 'html', 'iframe', 'legend', 'li', 'link', 'main', 'menu', 'menuitem', 'nav', 'noframes', 'ol', 'optgroup',
+        'option', 'p', 'param', 'search', 'section', 'summary', 'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'title', 'tr', 'track', 'ul'))
+    REG_RAW_BLANK_LINE = re.compile(b'^[ \t\x0b\x0c\x1c-\x1f\x80-\xff]*$', re.MULTILINE)
+
+    def __init__(self):
+        self._fence = None
+        self._html_end = None
+        self._previous = self.BLANK
+
+    @staticmethod
+    def is_atx_heading(line):
+        text = line.lstrip('#')
+        return len(text) > 1 and text[0] == ' ' and len(text) < len(line)
+
+    def scan(self, lines):
+        classify = self.classify
+        skip = self.skip
+        for line in lines:
+            yield line, classify(line) if line.__class__ is str else skip(line)
+
+    def skip(self, raw_lines):
+        data = raw_lines.data
+        if self._fence is not None:
+            kind = self.CODE
+        elif self._html_end is None:
+            kind = self.TEXT
+        else:
+            kind = self.HTML
+            if self._html_end:
+                flags = re.IGNORECASE if self._html_end.startswith('</') else 0
+                if re.search(re.escape(self._html_end.encode()), data, flags):
+                    self._html_end = None
+            elif self._has_raw_blank_line(data):
+                self._html_end = None
+        self._previous = self.BLANK if len(data) == 1 or data[-2] == 10 else self.TEXT
+        return kind
+
+    def _has_raw_blank_line(self, data):
+        for match in self.REG_RAW_BLANK_LINE.finditer(data):
+            if match.start() == len(data):
+                return False
+            line = bytes(data[match.start():match.end()])
+            if line.isascii() or line.decode('utf-8', 'replace').isspace():
+                return True
+        return False
+
+    def classify(self, line):
+        self._previous = kind = self._classify(line)
+        return kind
+
+    def _classify(self, line):
+        if self._fence is not None:
+            return self._classify_in_fence(line)
+        if self._html_end is not None:
+            return self._classify_in_html(line)
+        first = line[:1]
+        if first == '#':
+            return self.HEADING if self.is_atx_heading(line) else self.TEXT
+        if not line or line.isspace():
+            return self.BLANK
+        if first not in ' \t`~<':
+            return self.TEXT
+        text = line.lstrip(' \t')
+        indent = len(line[:len(line) - len(text)].expandtabs(4))
+        if indent >= 4:
+            return self.CODE if self._previous is not self.TEXT else self.TEXT
+        if text[:3] in ('```', '~~~'):
+            return self._open_fence(text)
+        if text[:1] == '<':
+            return self._open_html(text)
+        return self.TEXT
+
+    def _open_fence(self, text):
+        fence = text[:len(text) - len(text.lstrip(text[0]))]
+        if len(fence) < 3 or (fence[0] == '`' and '`' in text[len(fence):]):
+            return self.TEXT
+        self._fence = fence
+        return self.FENCE
+
+    def _classify_in_fence(self, line):
+        text = line.lstrip(' ')
+        if len(line) - len(text) < 4 and text.startswith(self._fence) and not text.lstrip(self._fence[0]).strip():
+            self._fence = None
+            return self.FENCE
+        return self.CODE
+
+    def _open_html(self, text):
+        lowered = text.lower()
+        if lowered.startswith('<!--'):
+            end = '-->'
+        elif lowered.startswith('<?'):
+            end = '?>'
+        elif lowered.startswith('<![cdata['):
+            end = ']]>'
+        elif lowered[1:2] == '!' and lowered[2:3].isalpha():
+            end = '>'
+        else:
+            name = lowered[2:] if lowered[1:2] == '/' else lowered[1:]
+            tag = name[:len(name) - len(name.lstrip('abcdefghijklmnopqrstuvwxyz0123456789'))]
+            rest = name[len(tag):]
+            if tag in self.HTML_RAW_TAGS and lowered[1:2] != '/' and rest[:1] in ('', ' ', '\t', '>'):
+                end = f'</{tag}>'
+            elif tag in self.HTML_BLOCK_TAGS and (rest[:1] in ('', ' ', '\t', '>') or rest.startswith('/>')):
+                end = ''
+            else:
+                return self.TEXT
+        if not end or end not in lowered[2:]:
+            self._html_end = end
+        return self.HTML
+
+    def _classify_in_html(self, line):
+        if not self._html_end:
+            if not line or line.isspace():
+                self._html_end = None
+                return self.BLANK
+            return self.HTML
+        if self._html_end in (line.lower() if self._html_end.startswith('</') else line):
+            self._html_end = None
+        return self.HTML
+
+
 class MarkdownParser:
-    REG_HEADING_CHAR = re.compile('^#+ .+')
 
     def _is_heading(self, line):
-        return re.match(self.REG_HEADING_CHAR, line) is not None
+        return BlockScanner.is_atx_heading(line)
+
+    @staticmethod
+    def heading_lines(lines):
+        return (line for line, kind in BlockScanner().scan(lines) if kind is BlockScanner.HEADING)
 
     @staticmethod
     def _add_new_level(index):
@@ -89,26 +492,65 @@ class MarkdownParser:
             shortened_index = self._remove_obsolete_levels(previous_index, current_header_level)
             return self._bump_last_level(shortened_index)
 
-    def _set_next_index(self, lines):
-        current_index = ()
-        for heading in (heading for heading in reversed(lines) if isinstance(heading, MarkdownHeading)):
-            next_index = heading.heading_indices.current
-            heading.heading_indices = HeadingIndices(heading.heading_indices.previous, heading.heading_indices.current, current_index)
-            current_index = next_index
+    @staticmethod
+    def _set_heading_indices(headings):
+        if _metrics is not None:
+            _metrics.count('headings', len(headings))
+        paths = HeadingIndex(array('l', (heading.heading_level for heading in headings)))
+        last_heading_number = len(headings) - 1
+        for heading_number, heading in enumerate(headings):
+            heading.heading_indices = HeadingIndices(paths[heading_number - 1] if heading_number > 0 else (),
+                                                     paths[heading_number],
+                                                     paths[heading_number + 1] if heading_number < last_heading_number else ())
 
     def _set_prev_and_current_index(self, lines):
         current_index = ()
+        for line in lines:
+            if isinstance(line, MarkdownHeading):
+                if _metrics is not None:
+                    _metrics.count('headings')
+                new_index = self._generate_index(current_index, line.heading_level)
+                line.heading_indices = HeadingIndices(current_index, new_index, None)
+                current_index = new_index
+            yield line
+
+    @staticmethod
+    def build_heading_tree(lines):
+        tree = {}
         for heading in (heading for heading in lines if isinstance(heading, MarkdownHeading)):
-            new_index = self._generate_index(current_index, heading.heading_level)
-            heading.heading_indices = HeadingIndices(current_index, new_index, None)
-            current_index = new_index
+            tree.setdefault(heading.heading_indices.current[:-1], []).append(heading)
+        return tree
+
+    @staticmethod
+    def _to_md_line(line, kind):
+        return MarkdownHeading(line) if kind is BlockScanner.HEADING else MarkdownLine(line)
 
     def parse(self, lines):
-        lines = [MarkdownHeading(line) if self._is_heading(line) else MarkdownLine(line) for line in lines]
-        self._set_prev_and_current_index(lines)
-        self._set_next_index(lines)
+        lines = list(_profiled('parse', (self._to_md_line(line, kind) for line, kind in BlockScanner().scan(lines))))
+        with _stage('index'):
+            self._set_heading_indices([line for line in lines if line.__class__ is MarkdownHeading])
         return lines
 
+    def iter_parse(self, lines):
+        return _profiled('index', self._set_prev_and_current_index(_profiled('parse', (self._to_md_line(line, kind) for line, kind in BlockScanner().scan(lines)))))
+
+    def parse_compact(self, lines):
+        with _stage('parse'):
+            return self._parse_compact(lines)
+
+    def _parse_compact(self, lines):
+        raw_lines, heading_positions, heading_levels = [], array('l'), array('l')
+        for position, (line, kind) in enumerate(BlockScanner().scan(lines)):
+            raw_lines.append(line)
+            if kind is BlockScanner.HEADING:
+                heading_positions.append(position)
+                heading_levels.append(len(line.partition(' ')[0]))
+        if _metrics is not None:
+            _metrics.count('headings', len(heading_positions))
+        with _stage('index'):
+            heading_paths = HeadingIndex(heading_levels)
+        return MarkdownLineStore(raw_lines, heading_positions, heading_levels, heading_paths)
+
 
 class MarkdownDocument:
     REG_SPACER_BETWEEN_HEADER_AND_LINK = re.compile('(?<=#) (?=\\[)')
@@ -123,50 +565,190 @@ class MarkdownDocument:
     def __init__(self, raw_lines, remove_old_toc=False):
         if remove_old_toc:
             raw_lines = list(self._cleansing_generator(raw_lines))
-        self.md_lines = MarkdownParser().parse(raw_lines)
+        self.md_lines = MarkdownParser().parse_compact(raw_lines)
+
+    @property
+    def md_lines(self):
+        return self._md_lines
+
+    @md_lines.setter
+    def md_lines(self, md_lines):
+        self._md_lines = md_lines if isinstance(md_lines, MarkdownLineStore) else MarkdownLineStore.from_md_lines(md_lines)
+        self._heading_tree = None
+
+    @property
+    def heading_tree(self):
+        if self._heading_tree is None:
+            self._heading_tree = MarkdownParser.build_heading_tree(self.md_lines.iter_headings())
+        return self._heading_tree
 
     @staticmethod
     def _cleansing_generator(lines):
-        lines = MarkdownDocument._remove_existing_tocs(lines)
-        for line in lines:
-            if line != '':
-                line = re.sub(MarkdownDocument.REG_SPACER_BETWEEN_HEADER_AND_LINK, '', line)
-                line = re.sub(MarkdownDocument.REG_INTERNAL_ANCHOR, '', line)
-                line = re.sub(MarkdownDocument.REG_INTERNAL_LINK, '', line)
-                if line:
-                    yield line
-            else:
-                yield line
+        return _profiled('cleanse', (line for _, line in MarkdownDocument._cleanse_with_positions(lines)))
+
+    @staticmethod
+    def _cleanse_with_positions(lines):
+        remove_spacer = MarkdownDocument.REG_SPACER_BETWEEN_HEADER_AND_LINK.sub
+        remove_anchor = MarkdownDocument.REG_INTERNAL_ANCHOR.sub
+        remove_link = MarkdownDocument.REG_INTERNAL_LINK.sub
+        for position, line in _profiled('remove_tocs', MarkdownDocument._remove_existing_tocs_with_positions(lines)):
+            if '#' in line or '<a' in line:
+                if '# [' in line:
+                    line = remove_spacer('', line)
+                if '<a' in line:
+                    line = remove_anchor('', line)
+                if '#[' in line:
+                    line = remove_link('', line)
+                if not line:
+                    continue
+            yield position, line
 
     @staticmethod
     def _remove_existing_tocs(lines):
-        try:
-            while True:
-                start = lines.index(MarkdownDocument.TOC_START)
-                end = lines.index(MarkdownDocument.TOC_END)
-                assert start < end
-                if lines[start - 1] == MarkdownDocument.TOC_EMPTY_LINE:
-                    start -= 1
-                lines = [line for index, line in enumerate(lines) if not (start <= index <= end)]
-        except ValueError:
-            pass
-        assert all(x not in [MarkdownDocument.TOC_START, MarkdownDocument.TOC_END] for x in lines)
-        return lines
+        return (line for _, line in MarkdownDocument._remove_existing_tocs_with_positions(lines))
+
+    @staticmethod
+    def _remove_existing_tocs_with_positions(lines):
+        in_toc = False
+        pending_empty_line = None
+        for position, line in enumerate(lines):
+            if line == MarkdownDocument.TOC_START:
+                if in_toc:
+                    raise InvalidTocError(f'Nested {MarkdownDocument.TOC_START} in line {position + 1}')
+                in_toc = True
+                pending_empty_line = None
+            elif line == MarkdownDocument.TOC_END:
+                if not in_toc:
+                    raise InvalidTocError(f'{MarkdownDocument.TOC_END} without {MarkdownDocument.TOC_START} in line {position + 1}')
+                in_toc = False
+                if _metrics is not None:
+                    _metrics.count('tocs_removed')
+            elif not in_toc:
+                if pending_empty_line is not None:
+                    yield pending_empty_line, MarkdownDocument.TOC_EMPTY_LINE
+                    pending_empty_line = None
+                if line == MarkdownDocument.TOC_EMPTY_LINE:
+                    pending_empty_line = position
+                else:
+                    yield position, line
+        if in_toc:
+            raise InvalidTocError(f'{MarkdownDocument.TOC_START} without {MarkdownDocument.TOC_END}')
+        if pending_empty_line is not None:
+            yield pending_empty_line, MarkdownDocument.TOC_EMPTY_LINE
 
     def _create_toc(self, toc_parent_index, start_level, end_level):
-        result = []
+        return list(self._iter_toc(toc_parent_index, start_level, end_level))
+
+    def _iter_toc(self, toc_parent_index, start_level, end_level):
+        return _profiled('create_toc', self._toc_generator(toc_parent_index, start_level, end_level))
+
+    def _toc_generator(self, toc_parent_index, start_level, end_level):
         parent_index_level = len(toc_parent_index)
-        toc_lines = [line.to_toc_entry(parent_index_level) for line in self.md_lines if isinstance(line, MarkdownHeading) and self._is_line_in_toc(line, toc_parent_index, start_level, end_level)]
-        if toc_lines:
-            result.append(self.TOC_START)
-            if parent_index_level == 0:
-                result.append(self.TOC_TOP_ANCHOR)
-                result.append(self.TOC_RULER)
-            result.extend(toc_lines)
-            if parent_index_level == 0:
-                result.append(self.TOC_RULER)
-            result.append(self.TOC_END)
-        return result
+        toc_lines = (line.to_toc_entry(parent_index_level) for line in self._iter_sub_headings(toc_parent_index) if self._is_line_in_toc(line, toc_parent_index, start_level, end_level))
+        first_toc_line = next(toc_lines, None)
+        if first_toc_line is None:
+            return
+        if parent_index_level and _metrics is not None:
+            _metrics.count('sub_tocs')
+        yield self.TOC_START
+        if parent_index_level == 0:
+            yield self.TOC_TOP_ANCHOR
+            yield self.TOC_RULER
+        yield first_toc_line
+        yield from toc_lines
+        if parent_index_level == 0:
+            yield self.TOC_RULER
+        yield self.TOC_END
+
+    def _paged_toc_headings(self, toc_parent_index, start_level, end_level, max_toc_entries):
+        headings = []
+        depths = []
+        ancestors = []
+        for heading in self._iter_sub_headings(toc_parent_index):
+            if self._is_line_in_toc(heading, toc_parent_index, start_level, end_level):
+                current = heading.heading_indices.current
+                while ancestors and ancestors[-1] != current[:len(ancestors[-1])]:
+                    ancestors.pop()
+                ancestors.append(current)
+                headings.append(heading)
+                depths.append(len(ancestors))
+        depth_counts = {}
+        for depth in depths:
+            depth_counts[depth] = depth_counts.get(depth, 0) + 1
+        entries = 0
+        for depth in sorted(depth_counts):
+            entries += depth_counts[depth]
+            if entries > max_toc_entries:
+                max_depth = max(depth - 1, 1)
+                listed = [heading for heading, depth in zip(headings, depths) if depth <= max_depth]
+                owners = [heading for heading, depth, following_depth in zip(headings, depths, depths[1:]) if depth == max_depth and following_depth > max_depth]
+                return listed, owners
+        return headings, []
+
+    def _iter_paged_toc(self, toc_parent_index, start_level, end_level, max_toc_entries, toc_owners, toc_pages):
+        entries, owners = self._paged_toc_headings(toc_parent_index, start_level, end_level, max_toc_entries)
+        for owner in owners:
+            toc_owners[owner.heading_indices.current] = (start_level, end_level)
+        if not entries:
+            return iter(())
+        page_size = max(max_toc_entries, 2)
+        depth = 1
+        while len(entries) > page_size:
+            entries = [TocPage(depth, len(toc_parent_index), entries[start:start + page_size]) for start in range(0, len(entries), page_size)]
+            depth += 1
+        self._register_toc_pages(entries, toc_pages)
+        return _profiled('create_toc', self._toc_page_generator(entries, len(toc_parent_index)))
+
+    @staticmethod
+    def _register_toc_pages(entries, toc_pages):
+        stack = [entry for entry in reversed(entries) if isinstance(entry, TocPage)]
+        while stack:
+            page = stack.pop()
+            toc_pages.setdefault(MarkdownDocument._first_toc_heading(page).heading_indices.current, []).append(page)
+            stack.extend(entry for entry in reversed(page.entries) if isinstance(entry, TocPage))
+
+    @staticmethod
+    def _first_toc_heading(entry, position=0):
+        while isinstance(entry, TocPage):
+            entry = entry.entries[position]
+        return entry
+
+    @staticmethod
+    def _toc_page_name(page):
+        return f'toc{page.depth}_{MarkdownHeading._anchor_name(MarkdownDocument._first_toc_heading(page).heading_indices.current)}'
+
+    def _toc_page_entry(self, entry, base_level):
+        if not isinstance(entry, TocPage):
+            return entry.to_toc_entry(base_level)
+        return f'* [{self._first_toc_heading(entry).text_after_heading} – {self._first_toc_heading(entry, -1).text_after_heading}](#{self._toc_page_name(entry)})'
+
+    def _toc_page_generator(self, entries, base_level, page=None):
+        is_main_toc = page is None and base_level == 0
+        if not is_main_toc and _metrics is not None:
+            _metrics.count('sub_tocs')
+        yield self.TOC_START
+        if is_main_toc:
+            yield self.TOC_TOP_ANCHOR
+            yield self.TOC_RULER
+        if page is not None:
+            yield f'<a name="{self._toc_page_name(page)}"></a>'
+        for entry in entries:
+            yield self._toc_page_entry(entry, base_level)
+        if is_main_toc:
+            yield self.TOC_RULER
+        yield self.TOC_END
+
+    def _iter_toc_pages(self, pages):
+        for page in pages:
+            yield from _profiled('create_toc', self._toc_page_generator(page.entries, page.base_level, page))
+
+    def _iter_sub_headings(self, toc_parent_index):
+        heading_tree = self.heading_tree
+        stack = list(reversed(heading_tree.get(toc_parent_index, [])))
+        while stack:
+            heading = stack.pop()
+            yield heading
+            stack.extend(reversed(heading_tree.get(heading.heading_indices.current, [])))
 
     def _is_line_in_toc(self, line, toc_parent_index, start_level, end_level):
         assert isinstance(line, MarkdownHeading)
@@ -199,43 +781,427 @@ class MarkdownDocument:
         else:
             return md_line.heading_level <= max_main_toc_level + extra_sub_toc_level
 
-    def dump(self, with_toc=False, with_navigation_arrows=False, with_debug=False, max_main_toc_level=0, extra_sub_toc_level=0):
-        lines = []
+    def _dump_generator(self, md_lines, with_toc, with_debug, max_main_toc_level, extra_sub_toc_level, max_toc_entries=0):
+        if with_toc and max_toc_entries:
+            yield from self._paged_dump_generator(md_lines, with_debug, max_main_toc_level, extra_sub_toc_level, max_toc_entries)
+            return
         if self._should_insert_toc_here(with_toc):
-            lines.extend(self._create_toc((), 0, max_main_toc_level))
-        for md_line in self.md_lines:
+            yield from self._iter_toc((), 0, max_main_toc_level)
+        for md_line in md_lines:
+            if not isinstance(md_line, MarkdownHeading):
+                yield md_line.raw_text if md_line.__class__ is MarkdownLine else md_line
+                continue
             with_anchor = self._needs_anchor(md_line, with_toc, max_main_toc_level, extra_sub_toc_level)
-            lines.extend(md_line.to_markdown(with_anchor=with_anchor, top_level=max_main_toc_level, sub_level=extra_sub_toc_level, with_debug=with_debug))
+            yield from md_line.to_markdown(with_anchor=with_anchor, top_level=max_main_toc_level, sub_level=extra_sub_toc_level, with_debug=with_debug)
             if self._should_insert_toc_here(with_toc, md_line, max_main_toc_level, max_main_toc_level + extra_sub_toc_level):
-                lines.extend(self._create_toc(md_line.heading_indices.current, md_line.heading_level + 1, md_line.heading_level + extra_sub_toc_level))
-        return lines
+                yield from self._iter_toc(md_line.heading_indices.current, md_line.heading_level + 1, md_line.heading_level + extra_sub_toc_level)
+
+    def _paged_dump_generator(self, md_lines, with_debug, max_main_toc_level, extra_sub_toc_level, max_toc_entries):
+        end_level = max_main_toc_level + extra_sub_toc_level if max_main_toc_level else 0
+        toc_owners = {}
+        toc_pages = {}
+        yield from self._iter_paged_toc((), 0, max_main_toc_level, max_toc_entries, toc_owners, toc_pages)
+        for md_line in md_lines:
+            if not isinstance(md_line, MarkdownHeading):
+                yield md_line.raw_text if md_line.__class__ is MarkdownLine else md_line
+                continue
+            current = md_line.heading_indices.current
+            if current in toc_pages:
+                yield from self._iter_toc_pages(toc_pages.pop(current))
+            with_anchor = self._needs_anchor(md_line, True, max_main_toc_level, extra_sub_toc_level)
+            yield from md_line.to_markdown(with_anchor=with_anchor, top_level=max_main_toc_level, sub_level=extra_sub_toc_level, with_debug=with_debug)
+            if current in toc_owners:
+                yield from self._iter_paged_toc(current, *toc_owners.pop(current), max_toc_entries, toc_owners, toc_pages)
+            elif self._should_insert_toc_here(True, md_line, max_main_toc_level, end_level):
+                yield from self._iter_paged_toc(current, md_line.heading_level + 1, end_level, max_toc_entries, toc_owners, toc_pages)
+
+    def iter_dump(self, with_toc=False, with_navigation_arrows=False, with_debug=False, max_main_toc_level=0, extra_sub_toc_level=0, max_toc_entries=0):
+        return _profiled('render', self._dump_generator(self.md_lines.iter_compact(), with_toc, with_debug, max_main_toc_level, extra_sub_toc_level, max_toc_entries))
+
+    def dump(self, with_toc=False, with_navigation_arrows=False, with_debug=False, max_main_toc_level=0, extra_sub_toc_level=0, max_toc_entries=0):
+        return list(self.iter_dump(with_toc, with_navigation_arrows, with_debug, max_main_toc_level, extra_sub_toc_level, max_toc_entries))
+
+    @classmethod
+    def stream(cls, read_lines, remove_old_toc=False, with_toc=False, with_navigation_arrows=False, with_debug=False, max_main_toc_level=0, extra_sub_toc_level=0, max_toc_entries=0):
+        def raw_lines():
+            return cls._cleansing_generator(read_lines()) if remove_old_toc else read_lines()
+
+        parser = MarkdownParser()
+        md_document = cls.__new__(cls)
+        if with_toc:
+            # the first pass only collects headings, lines and TOCs are counted once in the second pass
+            with _metrics.uncounted() if _metrics is not None else _NO_STAGE:
+                md_document.md_lines = parser.parse_compact(parser.heading_lines(raw_lines()))
+            if _metrics is not None:
+                _metrics.count('headings', len(md_document.md_lines.heading_positions))
+            headings = md_document.md_lines.iter_headings()
+            md_lines = _profiled('parse', (next(headings) if kind is BlockScanner.HEADING else MarkdownLine(line) for line, kind in BlockScanner().scan(raw_lines())))
+        else:
+            md_document.md_lines = []
+            md_lines = parser.iter_parse(raw_lines())
+        return _profiled('render', md_document._dump_generator(md_lines, with_toc, with_debug, max_main_toc_level, extra_sub_toc_level, max_toc_entries))
+
+
+class OutputSink:
+    CHUNK_LINES = 2048
+
+    def __init__(self, encoding=None):
+        self.encoding = encoding
+
+    def write_lines(self, lines):
+        with _stage('output'):
+            encoding = self.encoding or _locale_encoding()
+            written = 0
+            lines = iter(lines)
+            chunk = list(islice(lines, self.CHUNK_LINES))
+            while chunk:
+                written += self._write_chunk(chunk, encoding)
+                chunk = list(islice(lines, self.CHUNK_LINES))
+            self.flush()
+            if _metrics is not None:
+                _metrics.count('bytes_written', written)
+        return written
+
+    def _write_chunk(self, chunk, encoding):
+        chunk.append('')
+        try:
+            data = '\n'.join(chunk).encode(encoding)
+        except TypeError:
+            return self._write_mixed_chunk(chunk[:-1], encoding)
+        self.write(data)
+        return len(data)
+
+    def _write_mixed_chunk(self, chunk, encoding):
+        written = 0
+        lines = []
+        for line in chunk:
+            if line.__class__ is str:
+                lines.append(line)
+                continue
+            if lines:
+                written += self._write_chunk(lines, encoding)
+                lines = []
+            data = line.data if _is_utf_8(encoding) else bytes(line.data).decode('utf-8').encode(encoding)
+            self.write(data)
+            written += len(data)
+        if lines:
+            written += self._write_chunk(lines, encoding)
+        return written
+
+    def write(self, data):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+
+def _locale_encoding():
+    import locale
+    return locale.getpreferredencoding(False)
+
+
+def _is_utf_8(encoding):
+    import codecs
+    return codecs.lookup(encoding).name == 'utf-8'
+
+
+class FileDescriptorSink(OutputSink):
+
+    def __init__(self, fd, encoding=None):
+        super().__init__(encoding)
+        self.fd = fd
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.fd, view):]
+
+
+class StreamSink(OutputSink):
+
+    def __init__(self, stream, encoding=None):
+        super().__init__(encoding)
+        self.stream = stream
+
+    def write(self, data):
+        self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+
+
+class StdoutSink(OutputSink):
+
+    def write_lines(self, lines):
+        self.stdout = sys.stdout
+        self.stdout.flush()
+        if self.encoding is None:
+            self.encoding = getattr(self.stdout, 'encoding', None)
+        return super().write_lines(lines)
+
+    def write(self, data):
+        if hasattr(self.stdout, 'buffer'):
+            self.stdout.buffer.write(data)
+        else:
+            self.stdout.write(bytes(data).decode(self.encoding or _locale_encoding()))
+
+    def flush(self):
+        getattr(self.stdout, 'buffer', self.stdout).flush()
+
+
+class MemorySink(OutputSink):
+
+    def __init__(self, encoding='utf-8'):
+        super().__init__(encoding)
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+
+    def getvalue(self):
+        return b''.join(self.chunks).decode(self.encoding)
+
+    def lines(self):
+        return self.getvalue().split('\n')[:-1]
+
+
+class ComparingSink(OutputSink):
+
+    def __init__(self, original, sink=None, encoding=None):
+        super().__init__(sink.encoding if sink is not None else encoding)
+        self.original = original
+        self.size = len(original) if original[-1:] == b'\n' else len(original) + 1
+        self.sink = sink
+        self.position = 0
+        self.changed = False
+
+    def write(self, data):
+        end = self.position + len(data)
+        if not self.changed:
+            expected = self.original[self.position:end]
+            self.changed = data != (expected + b'\n' if end == self.size > len(self.original) else expected)
+        self.position = end
+        if self.sink is not None:
+            self.sink.write(data)
+
+    def is_changed(self):
+        return self.changed or self.position != self.size
 
 
 class MarkdownHelper:
+    MMAP_THRESHOLD = 1 << 26
+    MAPPED_LINE_MARKERS = ((b'#', (b'[', b' [')), (b'<', (b'a',)), (b'`', ()), (b'~', ()))
+    REG_MAPPED_INDENTED_LINE = re.compile(b' {1,3}[`~<]')
 
-    def __init__(self, path):
-        self.raw_content = self._read_from_file(path)
+    def __init__(self, path, cache=None, mapped=None):
+        self.path = path
+        self.cache = cache
+        self.mapped = mapped
 
     @staticmethod
     def _read_from_file(path):
         with open(path) as file:
-            return [line.rstrip('\n') for line in file]
+            for line in file:
+                yield line.rstrip('\n')
+
+    @staticmethod
+    def _read_mapped(path):
+        import mmap
+        with open(path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        if mapping is None or mapping.find(b'\r') != -1 or not _is_utf_8(_locale_encoding()):
+            yield from MarkdownHelper._read_from_file(path)
+            return
+        view = memoryview(mapping)
+        position = 0
+        for start in MarkdownHelper._iter_mapped_line_starts(mapping):
+            if start < position:
+                continue
+            end = mapping.find(b'\n', start)
+            end = size if end == -1 else end
+            if start > position:
+                if start - position == 1 or mapping[start - 2] == 10:
+                    if start - position > 1:
+                        yield RawLines(view[position:start - 1])
+                    yield ''
+                else:
+                    yield RawLines(view[position:start])
+            yield str(mapping[start:end], 'utf-8')
+            position = end + 1
+        if position < size:
+            last_start = max(mapping.rfind(b'\n', position, size - 1) + 1, position)
+            if mapping[size - 1] != 10:
+                if last_start > position:
+                    yield RawLines(view[position:last_start])
+                yield str(mapping[last_start:size], 'utf-8')
+            else:
+                yield RawLines(view[position:size])
+
+    @staticmethod
+    def _iter_mapped_line_starts(mapping):
+        import heapq
+        if MarkdownHelper.REG_MAPPED_INDENTED_LINE.match(mapping):
+            yield 0
+        yield from heapq.merge(*(MarkdownHelper._find_marked_lines(mapping, marker, followers) for marker, followers in MarkdownHelper.MAPPED_LINE_MARKERS),
+                               MarkdownHelper._find_indented_lines(mapping))
 
     @staticmethod
-    def _print_content(content):
-        print('\n'.join(content))
+    def _find_marked_lines(mapping, marker, followers):
+        position = mapping.find(marker)
+        while position != -1:
+            if position == 0 or mapping[position - 1] == 10:
+                yield position
+            elif followers and mapping[position + 1:position + 3].startswith(followers):
+                yield mapping.rfind(b'\n', 0, position) + 1
+                position = mapping.find(b'\n', position)
+                if position == -1:
+                    return
+            position = mapping.find(marker, position + 1)
+
+    @staticmethod
+    def _find_indented_lines(mapping):
+        match = MarkdownHelper.REG_MAPPED_INDENTED_LINE.match
+        position = mapping.find(b'\n ')
+        while position != -1:
+            if match(mapping, position + 1):
+                yield position + 1
+            position = mapping.find(b'\n ', position + 2)
+
+    def _should_map(self):
+        if self.mapped is None:
+            return os.path.getsize(self.path) >= self.MMAP_THRESHOLD
+        return self.mapped
+
+    @staticmethod
+    def _print_content(content, sink=None):
+        sink = sink or StdoutSink()
+        sink.write_lines(content)
+        return sink
+
+    @staticmethod
+    def _map_original(path):
+        import mmap
+        with open(path, 'rb') as file:
+            if not os.fstat(file.fileno()).st_size:
+                return None
+            mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if mapping.find(b'\r') != -1:
+            mapping.close()
+            return None
+        return mapping
+
+    def is_changed(self, content):
+        mapping = self._map_original(self.path) if self._should_map() else None
+        if mapping is not None:
+            with mapping:
+                sink = ComparingSink(mapping)
+                with _metrics.uncounted() if _metrics is not None else _NO_STAGE:
+                    sink.write_lines(content)
+                return sink.is_changed()
+        original = self._read_from_file(self.path)
+        sentinel = object()
+        for line in content:
+            if next(original, sentinel) != line:
+                return True
+        return next(original, sentinel) is not sentinel
+
+    def write_content(self, content):
+        import tempfile
+        target_path = os.path.realpath(self.path)
+        mapping = self._map_original(target_path) if self._should_map() else None
+        if mapping is not None:
+            with mapping:
+                return self._write_mapped_content(content, target_path, mapping)
+        original = self._read_from_file(target_path)
+        sentinel = object()
+        changed = False
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target_path), prefix='.mdh-', suffix='.tmp')
+
+        def compared(content):
+            nonlocal changed
+            for line in content:
+                if not changed and next(original, sentinel) != line:
+                    changed = True
+                yield line
+
+        try:
+            with _metrics.uncounted() if _metrics is not None else _NO_STAGE:
+                try:
+                    written = FileDescriptorSink(fd).write_lines(compared(content))
+                finally:
+                    os.close(fd)
+            if not changed and next(original, sentinel) is not sentinel:
+                changed = True
+            original.close()
+            if changed:
+                if _metrics is not None:
+                    _metrics.count('bytes_written', written)
+                os.chmod(temp_path, os.stat(target_path).st_mode & 0o7777)
+                os.replace(temp_path, target_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+        return changed
+
+    def _write_mapped_content(self, content, target_path, mapping):
+        import tempfile
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target_path), prefix='.mdh-', suffix='.tmp')
+        try:
+            with _metrics.uncounted() if _metrics is not None else _NO_STAGE:
+                try:
+                    sink = ComparingSink(mapping, FileDescriptorSink(fd))
+                    written = sink.write_lines(content)
+                finally:
+                    os.close(fd)
+            changed = sink.is_changed()
+            if changed:
+                if _metrics is not None:
+                    _metrics.count('bytes_written', written)
+                os.chmod(temp_path, os.stat(target_path).st_mode & 0o7777)
+                os.replace(temp_path, target_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+        return changed
+
+    def _stream(self, mapped=False, **kwargs):
+        if mapped:
+            return self._stream_mapped(**kwargs)
+        return MarkdownDocument.stream(lambda: _profiled('read', self._read_from_file(self.path), 'lines'), **kwargs)
+
+    def _stream_mapped(self, **kwargs):
+        try:
+            yield from MarkdownDocument.stream(lambda: _profiled('read', self._read_mapped(self.path)), **kwargs)
+        except InvalidTocError:
+            list(MarkdownDocument._remove_existing_tocs(self._read_from_file(self.path)))
+            raise
+
+    def dump_content(self, add_toc=False, remove_old_toc=False, with_debug=False, mapped=False):
+        return self._stream(mapped, remove_old_toc=remove_old_toc, with_toc=add_toc, with_debug=with_debug)
+
+    def cleanse_content(self, mapped=False):
+        return self._stream(mapped, remove_old_toc=True)
+
+    def add_toc_content(self, add_navigation=False, top_level=0, sub_level=0, max_toc_entries=0, mapped=False):
+        if self.cache is None:
+            return self._stream(mapped, remove_old_toc=True, with_toc=True, with_navigation_arrows=add_navigation, max_main_toc_level=top_level, extra_sub_toc_level=sub_level,
+                                max_toc_entries=max_toc_entries)
+        options = dict(command='add_toc', add_navigation=add_navigation, top_level=top_level, sub_level=sub_level)
+        if max_toc_entries:
+            options.update(max_toc_entries=max_toc_entries)
+        key = self.cache.file_key(self.path, options)
+        content = self.cache.iter_lines(key)
+        if content is None:
+            content = self.cache.put_lines(key, self._stream(mapped, remove_old_toc=True, with_toc=True, with_navigation_arrows=add_navigation, max_main_toc_level=top_level,
+                                                             extra_sub_toc_level=sub_level, max_toc_entries=max_toc_entries))
+        return content
 
-    def dump(self, add_toc=False, remove_old_toc=False, with_debug=False):
-        md_document = MarkdownDocument(raw_lines=self.raw_content, remove_old_toc=remove_old_toc)
-        content = md_document.dump(with_toc=add_toc, with_debug=with_debug)
-        self._print_content(content)
+    def dump(self, add_toc=False, remove_old_toc=False, with_debug=False, sink=None):
+        return self._print_content(self._stream(self._should_map(), remove_old_toc=remove_old_toc, with_toc=add_toc, with_debug=with_debug), sink)
 
-    def cleanse(self):
-        md_document = MarkdownDocument(raw_lines=self.raw_content, remove_old_toc=True)
-        content = md_document.dump()
-        self._print_content(content)
+    def cleanse(self, sink=None):
+        return self._print_content(self._stream(self._should_map(), remove_old_toc=True), sink)
 
-    def add_toc(self, add_navigation=False, top_level=0, sub_level=0):
-        md_document = MarkdownDocument(raw_lines=self.raw_content, remove_old_toc=True)
-        content = md_document.dump(with_toc=True, with_navigation_arrows=add_navigation, max_main_toc_level=top_level, extra_sub_toc_level=sub_level)
-        self._print_content(content)
+    def add_toc(self, add_navigation=False, top_level=0, sub_level=0, sink=None, max_toc_entries=0):
+        return self._print_content(self.add_toc_content(add_navigation=add_navigation, top_level=top_level, sub_level=sub_level, max_toc_entries=max_toc_entries, mapped=self._should_map()), sink)
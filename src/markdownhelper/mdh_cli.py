@@ -1,8 +1,52 @@
+import signal
+import subprocess
 import sys
 
 import click
 
-from .markdown_helper import MarkdownHelper
+from .batch import CHECK, DIFF, IN_PLACE, PRINT, git_changed_paths, read_path_list, select_markdown_files
+from .cache import ResultCache
+from .fast_cli import client, run
+
+
+def _output_mode(in_place, check, diff=False):
+    if in_place + check + diff > 1:
+        raise click.UsageError('--in-place, --check and --diff are mutually exclusive')
+    return IN_PLACE if in_place else CHECK if check else DIFF if diff else PRINT
+
+
+def _profile_option(function):
+    function = click.option('--profile-format', type=click.Choice(['text', 'json']), default='text', help='Format of the --profile report')(function)
+    return click.option('--profile', is_flag=True, help='Reports time spent per stage and counters to stderr')(function)
+
+
+def _selected_paths(paths, files_from, changed_since):
+    if files_from and changed_since:
+        raise click.UsageError('--files-from and --changed-since are mutually exclusive')
+    if not (files_from or changed_since):
+        if not paths:
+            raise click.UsageError('Missing argument "PATHS..."')
+        return paths
+    if files_from:
+        return list(select_markdown_files(read_path_list(files_from), paths))
+    try:
+        return list(select_markdown_files(git_changed_paths(changed_since), paths))
+    except subprocess.CalledProcessError as e:
+        raise click.ClickException(e.stderr.strip())
+    except OSError as e:
+        raise click.ClickException(str(e))
+
+
+def _validate_max_toc_entries(ctx, param, value):
+    if value < 0 or value == 1:
+        raise click.BadParameter('must be 0 or at least 2')
+    return value
+
+
+def _run(paths, jobs, command, options, mode=PRINT, cache=None, profile=None, summary_format='text'):
+    exit_code = run(paths, jobs, command, options, mode, cache, profile, summary_format)
+    if exit_code:
+        sys.exit(exit_code)
 
 
 @click.group()
@@ -11,25 +55,98 @@ def mdh():
 
 
 @mdh.command(help='Dumps markdown document to console')
-@click.argument('path')
+@click.argument('paths', nargs=-1, required=True)
 @click.option('--debug/--no-debug', default=False, help='Displays debug information')
-def dump(path, debug):
-    MarkdownHelper(path=path).dump(add_toc=False, remove_old_toc=False, with_debug=debug)
+@click.option('--jobs', default=1, help='Number of worker processes for multiple files')
+@_profile_option
+def dump(paths, debug, jobs, profile, profile_format):
+    _run(paths, jobs, 'dump', dict(add_toc=False, remove_old_toc=False, with_debug=debug), profile=profile_format if profile else None)
 
 
 @mdh.command(help='Removes existing TOC and all internal links')
-@click.argument('path')
-def cleanse(path):
-    MarkdownHelper(path=path).cleanse()
+@click.argument('paths', nargs=-1, required=True)
+@click.option('--jobs', default=1, help='Number of worker processes for multiple files')
+@click.option('--in-place', is_flag=True, help='Rewrites files instead of printing them, unchanged files are not touched')
+@click.option('--check', is_flag=True, help='Fails if any file would be changed')
+@_profile_option
+def cleanse(paths, jobs, in_place, check, profile, profile_format):
+    _run(paths, jobs, 'cleanse', dict(), _output_mode(in_place, check), profile=profile_format if profile else None)
 
 
 @mdh.command(help='Adds TOC to top of file. If exists, removes old TOC first.')
-@click.argument('path')
+@click.argument('paths', nargs=-1)
 @click.option('--top-level', default=2, help='Only go top-levels deep. Leave empty or zero for all levels')
 @click.option('--sub-level', default=2, help='Render sub TOCs under every header of top-level')
 @click.option('--navigation/--bbbno-navigation', default=True, help='Adds navigation links to headers')
-def toc(path, top_level, sub_level, navigation):
-    MarkdownHelper(path=path).add_toc(add_navigation=navigation, top_level=top_level, sub_level=sub_level)
+@click.option('--max-toc-entries', default=0, callback=_validate_max_toc_entries, help='Limits every TOC to this many entries by leaving out deeper levels, which move into sub TOCs under their section headers, and by splitting larger levels into ranges. Leave empty or zero for no limit')
+@click.option('--jobs', default=1, help='Number of worker processes for multiple files')
+@click.option('--in-place', is_flag=True, help='Rewrites files instead of printing them, unchanged files are not touched')
+@click.option('--check', is_flag=True, help='Fails if any TOC is stale')
+@click.option('--diff', is_flag=True, help='Prints a patch of the heading lines and TOC blocks that change')
+@click.option('--cache/--no-cache', default=True, help='Reuses results of earlier runs on identical input')
+@click.option('--files-from', type=click.File('r'), help='Reads the files to process from a list of paths, one per line, - for stdin. Only markdown files are processed')
+@click.option('--changed-since', metavar='REF', help='Processes the markdown files that git diff --name-only REF reports as changed')
+@click.option('--summary-format', type=click.Choice(['text', 'json']), default='text', help='Format of the summary printed to stderr')
+@_profile_option
+def toc(paths, top_level, sub_level, navigation, max_toc_entries, jobs, in_place, check, diff, cache, files_from, changed_since, summary_format, profile, profile_format):
+    _run(_selected_paths(paths, files_from, changed_since), jobs, 'add_toc', dict(add_navigation=navigation, top_level=top_level, sub_level=sub_level, max_toc_entries=max_toc_entries),
+         _output_mode(in_place, check, diff), ResultCache() if cache else None, profile_format if profile else None, summary_format)
+
+
+@mdh.command(help='Writes one index linking to the headings of all documents, re-parses only changed files on later runs')
+@click.argument('paths', nargs=-1, required=True)
+@click.option('--output', default='INDEX.md', help='Markdown file the index is written to')
+@click.option('--index-file', help='Keeps parsed headings between runs, defaults to .mdh_index.json next to the output')
+@click.option('--top-level', default=0, help='Only go top-levels deep. Leave empty or zero for all levels')
+@click.option('--jobs', default=1, help='Number of worker processes for changed files')
+@click.option('--toc-top-level', default=2, help='--top-level the documents were rendered with by mdh toc, only headings that got an anchor are linked')
+@click.option('--toc-sub-level', default=2, help='--sub-level the documents were rendered with by mdh toc')
+def index(paths, output, index_file, top_level, jobs, toc_top_level, toc_sub_level):
+    from .batch import ERROR
+    from .index import DocumentIndex
+    document_index = DocumentIndex(output, index_file, top_level, jobs, toc_top_level, toc_sub_level)
+    document_index.update(paths)
+    for line in document_index.summary():
+        click.echo(line, err=True)
+    if document_index.count(ERROR):
+        sys.exit(1)
+
+
+@mdh.command(help='Serves toc, cleanse and dump requests as JSON-RPC on a Unix socket or stdin/stdout')
+@click.option('--socket', 'socket_path', help='Socket to listen on, defaults to $MDH_SOCKET or a per-user socket')
+@click.option('--stdio', is_flag=True, help='Reads requests from stdin and writes responses to stdout')
+def serve(socket_path, stdio):
+    from .server import MarkdownServer, MarkdownSocketServer, UnsafeSocketError, default_socket_path
+    if stdio:
+        MarkdownServer().serve_stdio(sys.stdin, sys.stdout)
+        return
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server = MarkdownSocketServer(socket_path or default_socket_path())
+    except UnsafeSocketError as e:
+        raise click.ClickException(str(e))
+    with server:
+        click.echo(f'Listening on {server.server_address}', err=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+@mdh.command(name='client', help='Sends toc or cleanse to a running server, runs in-process if there is none', context_settings=dict(ignore_unknown_options=True))
+@click.argument('args', nargs=-1, type=click.UNPROCESSED)
+def client_command(args):
+    sys.exit(client(list(args)))
+
+
+@mdh.group(name='cache', help='Manages the result cache of the toc command')
+def cache_group():
+    pass
+
+
+@cache_group.command(help='Removes all cached results')
+def clear():
+    click.echo(f'Removed {ResultCache().clear()} cached results')
 
 
 if __name__ == '__main__':
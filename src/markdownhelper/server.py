@@ -0,0 +1,184 @@
+import json
+import os
+import socket
+import socketserver
+import stat
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+
+from .markdown_helper import InvalidTocError, MarkdownDocument, MarkdownHelper
+
+PARSE_ERROR = -32700
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+SERVER_ERROR = -32000
+
+
+class ServerUnavailable(Exception):
+    pass
+
+
+class ServerError(Exception):
+    pass
+
+
+class UnsafeSocketError(Exception):
+    pass
+
+
+def _check_private(path, is_kind, kind):
+    info = os.lstat(path)
+    if not is_kind(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise UnsafeSocketError(f'{path} is not a {kind} owned by the current user and inaccessible to others')
+
+
+def _private_directory(path):
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    _check_private(path, stat.S_ISDIR, 'directory')
+    return path
+
+
+def default_socket_path():
+    if 'MDH_SOCKET' in os.environ:
+        return os.environ['MDH_SOCKET']
+    if os.environ.get('XDG_RUNTIME_DIR'):
+        return os.path.join(os.environ['XDG_RUNTIME_DIR'], f'mdh-{os.getuid()}.sock')
+    return os.path.join(_private_directory(os.path.join(tempfile.gettempdir(), f'mdh-{os.getuid()}')), 'mdh.sock')
+
+
+def _peer_uid(sock):
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return os.getuid()
+    return struct.unpack('3i', sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i')))[1]
+
+
+class MarkdownServer:
+    METHODS = ('add_toc', 'cleanse', 'dump')
+
+    def __init__(self, max_documents=128):
+        self.max_documents = max_documents
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _document(self, path, remove_old_toc):
+        stat = os.stat(path)
+        key, stamp = (os.path.abspath(path), remove_old_toc), (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._documents.get(key)
+            if cached and cached[0] == stamp:
+                self._documents.move_to_end(key)
+                return cached[1]
+        md_document = MarkdownDocument(raw_lines=list(MarkdownHelper._read_from_file(path)), remove_old_toc=remove_old_toc)
+        with self._lock:
+            self._documents[key] = (stamp, md_document)
+            self._documents.move_to_end(key)
+            while len(self._documents) > self.max_documents:
+                self._documents.popitem(last=False)
+        return md_document
+
+    def add_toc(self, path, add_navigation=False, top_level=0, sub_level=0, max_toc_entries=0):
+        return self._document(path, True).dump(with_toc=True, with_navigation_arrows=add_navigation, max_main_toc_level=top_level, extra_sub_toc_level=sub_level, max_toc_entries=max_toc_entries)
+
+    def cleanse(self, path):
+        return self._document(path, True).dump()
+
+    def dump(self, path, add_toc=False, remove_old_toc=False, with_debug=False):
+        return self._document(path, remove_old_toc).dump(with_toc=add_toc, with_debug=with_debug)
+
+    def handle(self, request):
+        request_id = request.get('id') if isinstance(request, dict) else None
+        if not isinstance(request, dict) or request.get('method') not in self.METHODS:
+            return self._error(request_id, METHOD_NOT_FOUND, 'Method not found')
+        try:
+            content = getattr(self, request['method'])(**request.get('params', {}))
+        except TypeError as e:
+            return self._error(request_id, INVALID_PARAMS, str(e))
+        except (OSError, UnicodeDecodeError, InvalidTocError) as e:
+            return self._error(request_id, SERVER_ERROR, str(e))
+        return dict(jsonrpc='2.0', id=request_id, result=dict(content=content))
+
+    @staticmethod
+    def _error(request_id, code, message):
+        return dict(jsonrpc='2.0', id=request_id, error=dict(code=code, message=message))
+
+    def handle_line(self, line):
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return json.dumps(self._error(None, PARSE_ERROR, str(e)))
+        return json.dumps(self.handle(request))
+
+    def serve_stdio(self, stdin, stdout):
+        for line in stdin:
+            if line.strip():
+                stdout.write(self.handle_line(line) + '\n')
+                stdout.flush()
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        if _peer_uid(self.request) != os.getuid():
+            return
+        for line in self.rfile:
+            if line.strip():
+                self.wfile.write(self.server.markdown_server.handle_line(line.decode()).encode() + b'\n')
+
+
+class MarkdownSocketServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, markdown_server=None):
+        if os.path.exists(socket_path):
+            if _is_listening(socket_path):
+                raise OSError(f'Another server is listening on {socket_path}')
+            os.unlink(socket_path)
+        umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, _RequestHandler)
+        finally:
+            os.umask(umask)
+        self.markdown_server = markdown_server or MarkdownServer()
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def _connect(socket_path):
+    try:
+        _check_private(socket_path, stat.S_ISSOCK, 'socket')
+    except FileNotFoundError as e:
+        raise ServerUnavailable(str(e))
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except (FileNotFoundError, ConnectionRefusedError) as e:
+        sock.close()
+        raise ServerUnavailable(str(e))
+    return sock
+
+
+def _is_listening(socket_path):
+    try:
+        _connect(socket_path).close()
+    except ServerUnavailable:
+        return False
+    return True
+
+
+def call(method, params, socket_path=None):
+    with _connect(socket_path or default_socket_path()) as sock:
+        with sock.makefile('rwb') as stream:
+            stream.write(json.dumps(dict(jsonrpc='2.0', id=1, method=method, params=params)).encode() + b'\n')
+            stream.flush()
+            response = json.loads(stream.readline())
+    if 'error' in response:
+        raise ServerError(response['error']['message'])
+    return response['result']['content']
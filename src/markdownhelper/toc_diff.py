@@ -0,0 +1,57 @@
+from collections import namedtuple
+
+from .markdown_helper import MarkdownDocument
+
+Hunk = namedtuple('Hunk', ['old_start', 'old_lines', 'new_start', 'new_lines'])
+
+
+def _segment_hunk(old_lines, old_start, old_end, new_lines, new_start, new_end):
+    while old_start < old_end and new_start < new_end and old_lines[old_start] == new_lines[new_start]:
+        old_start += 1
+        new_start += 1
+    while old_start < old_end and new_start < new_end and old_lines[old_end - 1] == new_lines[new_end - 1]:
+        old_end -= 1
+        new_end -= 1
+    if old_start == old_end and new_start == new_end:
+        return None
+    return Hunk(old_start, old_lines[old_start:old_end], new_start, new_lines[new_start:new_end])
+
+
+def diff_lines(old_lines, new_lines):
+    old_positions = list(MarkdownDocument._cleanse_with_positions(old_lines))
+    new_positions = list(MarkdownDocument._cleanse_with_positions(new_lines))
+    if [line for _, line in old_positions] != [line for _, line in new_positions]:
+        hunk = _segment_hunk(old_lines, 0, len(old_lines), new_lines, 0, len(new_lines))
+        return [hunk] if hunk else []
+    hunks = []
+    old_start = new_start = 0
+    for (old_position, _), (new_position, _) in zip(old_positions + [(len(old_lines) - 1, None)], new_positions + [(len(new_lines) - 1, None)]):
+        hunk = _segment_hunk(old_lines, old_start, old_position + 1, new_lines, new_start, new_position + 1)
+        if hunk:
+            previous = hunks[-1] if hunks else None
+            if previous and previous.old_start + len(previous.old_lines) == hunk.old_start and previous.new_start + len(previous.new_lines) == hunk.new_start:
+                hunks[-1] = Hunk(previous.old_start, previous.old_lines + hunk.old_lines, previous.new_start, previous.new_lines + hunk.new_lines)
+            else:
+                hunks.append(hunk)
+        old_start, new_start = old_position + 1, new_position + 1
+    return hunks
+
+
+class TocDiff:
+
+    def __init__(self, old_lines, add_navigation=False, top_level=0, sub_level=0, max_toc_entries=0):
+        self.old_lines = old_lines
+        self.new_lines = list(MarkdownDocument.stream(lambda: iter(old_lines), remove_old_toc=True, with_toc=True, with_navigation_arrows=add_navigation,
+                                                      max_main_toc_level=top_level, extra_sub_toc_level=sub_level, max_toc_entries=max_toc_entries))
+        self.hunks = diff_lines(old_lines, self.new_lines)
+
+    def unified_diff(self, path):
+        if not self.hunks:
+            return []
+        result = [f'--- {path}', f'+++ {path}']
+        for hunk in self.hunks:
+            old_length, new_length = len(hunk.old_lines), len(hunk.new_lines)
+            result.append(f'@@ -{hunk.old_start + (1 if old_length else 0)},{old_length} +{hunk.new_start + (1 if new_length else 0)},{new_length} @@')
+            result.extend(f'-{line}' for line in hunk.old_lines)
+            result.extend(f'+{line}' for line in hunk.new_lines)
+        return result
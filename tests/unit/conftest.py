@@ -0,0 +1,11 @@
+import os
+
+import pytest
+
+
+@pytest.fixture
+def doc(tmp_path):
+    path = os.path.join(tmp_path, 'doc.md')
+    with open(path, 'w') as testfile:
+        testfile.write('# foo\nbar\n')
+    return path
@@ -0,0 +1,78 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from markdownhelper.aio import AsyncMarkdownHelper, iter_lines, process_many
+from markdownhelper.batch import CHANGED, ERROR, UNCHANGED
+from markdownhelper.markdown_helper import MarkdownHelper
+
+
+class ChunkStream:
+
+    def __init__(self, chunks, name=None):
+        self.chunks = chunks
+        self.name = name
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            await asyncio.sleep(0)
+            yield chunk
+
+
+def collect(async_iterable):
+    async def to_list():
+        return [item async for item in async_iterable]
+    return asyncio.run(to_list())
+
+
+def test_should_split_byte_and_line_streams():
+    assert collect(iter_lines(ChunkStream([b'# f', b'\xc3', b'\xbc\r', b'\nbar\r', b'baz']))) == ['# fü', 'bar', 'baz']
+    assert collect(iter_lines(ChunkStream(['# foo\n', 'bar\n', '\n']))) == ['# foo', 'bar', '']
+    assert collect(iter_lines(ChunkStream([]))) == []
+
+
+def test_should_render_paths_and_streams_like_markdown_helper(doc):
+    with open(doc, 'a') as testfile:
+        testfile.write('## baz\n')
+    expected = list(MarkdownHelper(doc).add_toc_content(add_navigation=True, top_level=1, sub_level=1))
+    helper = AsyncMarkdownHelper()
+    assert asyncio.run(helper.add_toc(doc, add_navigation=True, top_level=1, sub_level=1)) == expected
+    with open(doc, 'rb') as testfile:
+        stream = ChunkStream([testfile.read()])
+    assert asyncio.run(helper.add_toc(stream, add_navigation=True, top_level=1, sub_level=1)) == expected
+    assert asyncio.run(helper.cleanse(doc)) == ['# foo', 'bar', '## baz']
+    assert asyncio.run(helper.dump(doc, with_debug=True)) == ['# (1,) foo', 'bar', '## (1, 1) baz']
+
+
+def test_should_offload_and_stream_in_chunks(doc, monkeypatch):
+    monkeypatch.setattr('markdownhelper.aio.CHUNK_LINES', 2)
+    expected = list(MarkdownHelper(doc).add_toc_content())
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        helper = AsyncMarkdownHelper(executor, offload_threshold=0)
+        assert asyncio.run(helper.add_toc(doc)) == expected
+        assert collect(helper.stream(doc, 'add_toc', dict())) == expected
+
+
+def test_should_process_many_with_bounded_concurrency(doc, tmp_path):
+    active = []
+    max_active = []
+
+    class SlowStream(ChunkStream):
+
+        async def __aiter__(self):
+            active.append(self)
+            max_active.append(len(active))
+            for _ in range(3):
+                await asyncio.sleep(0)
+            active.remove(self)
+            for chunk in self.chunks:
+                yield chunk
+
+    sources = [SlowStream([b'# foo\n'], name=f'doc{number}.md') for number in range(6)]
+    sources += [doc, os.path.join(tmp_path, 'missing.md'), ChunkStream(['<!-- toc_start -->\n'])]
+    results = asyncio.run(process_many(sources, 'cleanse', dict(), concurrency=2))
+    assert max(max_active) == 2
+    assert [result.status for result in results] == [UNCHANGED] * 7 + [ERROR, ERROR]
+    assert [result.path for result in results[:2]] == ['doc0.md', 'doc1.md']
+    assert results[6].path == doc
+    assert asyncio.run(process_many([doc], 'add_toc', dict()))[0].status == CHANGED
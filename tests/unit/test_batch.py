@@ -0,0 +1,107 @@
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from markdownhelper.batch import CHANGED, CHECK, ERROR, IN_PLACE, UNCHANGED, BatchRun, expand_paths, git_changed_paths, process_file, read_path_list, select_markdown_files
+from markdownhelper.fast_cli import run
+
+
+@pytest.fixture
+def docs(tmp_path):
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / '.hidden').mkdir()
+    (tmp_path / 'a.md').write_text('# foo\nbar\n')
+    (tmp_path / 'sub' / 'b.md').write_text('bar\n')
+    (tmp_path / 'sub' / 'c.txt').write_text('# foo\n')
+    (tmp_path / '.hidden' / 'd.md').write_text('# foo\n')
+    (tmp_path / 'broken.markdown').write_text('<!-- toc_start -->\n')
+    return tmp_path
+
+
+def test_should_expand_directories_and_globs(docs):
+    assert list(expand_paths([str(docs)])) == [os.path.join(docs, 'a.md'), os.path.join(docs, 'broken.markdown'), os.path.join(docs, 'sub', 'b.md')]
+    assert list(expand_paths([os.path.join(docs, '**', '*.md')])) == [os.path.join(docs, 'a.md'), os.path.join(docs, 'sub', 'b.md')]
+    assert list(expand_paths([os.path.join(docs, 'a.md'), str(docs / 'sub')])) == [os.path.join(docs, 'a.md'), os.path.join(docs, 'sub', 'b.md')]
+    assert list(expand_paths(['missing.md'])) == ['missing.md']
+
+
+def test_should_take_existing_paths_literally_and_keep_unmatched_globs(docs):
+    (docs / 'notes[1].md').write_text('# foo\n')
+    assert list(expand_paths([str(docs / 'notes[1].md')])) == [str(docs / 'notes[1].md')]
+    assert [result.status for result in BatchRun('cleanse', {}).run([str(docs / 'notes[1].md')])] == [UNCHANGED]
+    batch_run = BatchRun('cleanse', {})
+    assert [result.status for result in batch_run.run([str(docs / '*.rst')])] == [ERROR]
+    assert batch_run.results[0].path == str(docs / '*.rst')
+
+
+def test_should_process_file(docs):
+    assert process_file(str(docs / 'a.md'), 'cleanse', {}).status == UNCHANGED
+    result = process_file(str(docs / 'a.md'), 'add_toc', dict(top_level=0, sub_level=0))
+    assert result.status == CHANGED
+    assert result.content[-2:] == ['# [↖](#top) foo', 'bar']
+    assert process_file(str(docs / 'broken.markdown'), 'cleanse', {}).status == ERROR
+    assert process_file(str(docs / 'missing.md'), 'cleanse', {}).status == ERROR
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_should_summarize_batch_run(docs, jobs):
+    batch_run = BatchRun('add_toc', dict(top_level=0, sub_level=0), jobs=jobs)
+    results = list(batch_run.run([str(docs)]))
+    assert [result.status for result in results] == [CHANGED, ERROR, UNCHANGED]
+    summary = batch_run.summary()
+    assert summary[0] == f'changed    {os.path.join(docs, "a.md")}'
+    assert summary[1].startswith(f'error      {os.path.join(docs, "broken.markdown")}: ')
+    assert summary[-1].startswith('3 files (1 changed, 1 unchanged, 1 errors) in ')
+
+
+def test_should_check_and_rewrite_in_place(docs):
+    options = dict(top_level=0, sub_level=0)
+    assert [result.status for result in BatchRun('add_toc', options, mode=CHECK).run([str(docs / 'a.md')])] == [CHANGED]
+    assert [result.status for result in BatchRun('add_toc', options, mode=IN_PLACE).run([str(docs / 'a.md')])] == [CHANGED]
+    assert [result.status for result in BatchRun('add_toc', options, mode=CHECK).run([str(docs / 'a.md')])] == [UNCHANGED]
+    assert (docs / 'a.md').read_text().startswith('<!-- toc_start -->\n')
+
+
+def test_should_merge_metrics_of_profiled_batch_run(docs):
+    batch_run = BatchRun('add_toc', dict(top_level=0, sub_level=0), profile=True)
+    results = list(batch_run.run([str(docs)]))
+    assert all(result.metrics for result in results if result.status != ERROR)
+    assert batch_run.metrics.counters['lines'] == 3
+    assert batch_run.metrics.counters['headings'] == 1
+    assert 'create_toc' in batch_run.metrics.timings
+    assert BatchRun('cleanse', {}).metrics is None
+
+
+def test_should_select_markdown_files_from_path_list(docs):
+    candidates = read_path_list([f'{docs / "a.md"}\n', '\n', f'{docs / "sub" / "c.txt"}\r\n', f'{docs / "deleted.md"}\n', f'{docs / "sub" / "b.md"}'])
+    assert list(select_markdown_files(candidates)) == [str(docs / 'a.md'), str(docs / 'sub' / 'b.md')]
+    assert list(select_markdown_files(candidates, [str(docs / 'sub')])) == [str(docs / 'sub' / 'b.md')]
+
+
+@pytest.mark.skipif(shutil.which('git') is None, reason='git is not installed')
+def test_should_list_files_changed_since_git_ref(docs):
+    def git(*args):
+        subprocess.run(['git', '-c', 'user.name=mdh', '-c', 'user.email=mdh@example.com', *args], cwd=docs, stdout=subprocess.PIPE, check=True)
+
+    git('init', '-q')
+    git('add', '.')
+    git('commit', '-q', '-m', 'initial')
+    (docs / 'a.md').write_text('# changed\n')
+    (docs / 'sub' / 'c.txt').write_text('# changed\n')
+    (docs / 'sub' / 'b.md').unlink()
+    assert [os.path.realpath(path) for path in git_changed_paths('HEAD', cwd=str(docs / 'sub'))] == [os.path.realpath(docs / 'a.md'), os.path.realpath(docs / 'sub' / 'c.txt')]
+    assert [os.path.realpath(path) for path in select_markdown_files(git_changed_paths('HEAD', cwd=str(docs)))] == [os.path.realpath(docs / 'a.md')]
+    with pytest.raises(subprocess.CalledProcessError):
+        git_changed_paths('no-such-ref', cwd=str(docs))
+
+
+def test_should_report_batch_run_as_json(docs, capsys):
+    assert run([str(docs / 'a.md')], 1, 'add_toc', dict(top_level=0, sub_level=0), CHECK, summary_format='json') == 1
+    report = json.loads(capsys.readouterr().err)
+    assert report['files'] == [dict(path=str(docs / 'a.md'), status=CHANGED, error=None)]
+    assert (report['changed'], report['unchanged'], report['errors']) == (1, 0, 0)
+    assert run([], 1, 'add_toc', dict(), CHECK, summary_format='json') == 0
+    assert json.loads(capsys.readouterr().err)['files'] == []
@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+from markdownhelper.cache import ResultCache
+from markdownhelper.markdown_helper import MarkdownHelper
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(directory=os.path.join(tmp_path, 'cache'), max_size=100)
+
+
+def test_should_key_on_content_and_options(cache):
+    assert cache.key(b'# foo', dict(top_level=1)) == cache.key(b'# foo', dict(top_level=1))
+    assert cache.key(b'# foo', dict(top_level=1)) != cache.key(b'# foo', dict(top_level=2))
+    assert cache.key(b'# foo', dict(top_level=1)) != cache.key(b'# bar', dict(top_level=1))
+
+
+def test_should_store_and_clear_content(cache):
+    assert cache.get('foo') is None
+    cache.put('foo', ['# foo', '', 'bar'])
+    cache.put('empty', [])
+    assert cache.get('foo') == ['# foo', '', 'bar']
+    assert cache.get('empty') == []
+    assert cache.clear() == 2
+    assert cache.get('foo') is None
+
+
+def test_should_evict_least_recently_used(cache):
+    cache.put('first', ['x' * 39])
+    cache.put('second', ['x' * 39])
+    os.utime(cache._entry_path('first'), (1, 1))
+    os.utime(cache._entry_path('second'), (2, 2))
+    assert cache.get('first') is not None
+    cache.put('third', ['x' * 39])
+    assert cache.get('second') is None
+    assert cache.get('first') is not None
+    assert cache.get('third') is not None
+
+
+def test_should_key_files_like_content(cache, tmp_path):
+    path = os.path.join(tmp_path, 'doc.md')
+    with open(path, 'wb') as testfile:
+        testfile.write(b'# foo\n' * 1000)
+    assert cache.file_key(path, dict(top_level=1)) == cache.key(b'# foo\n' * 1000, dict(top_level=1))
+
+
+def test_should_store_lines_while_they_are_consumed(cache):
+    lines = cache.put_lines('foo', iter(['# foo', 'bar']))
+    assert next(lines) == '# foo'
+    assert cache.get('foo') is None
+    assert list(lines) == ['bar']
+    assert list(cache.iter_lines('foo')) == ['# foo', 'bar']
+    cache.put_lines('partial', iter(['# foo', 'bar'])).__next__()
+    assert cache.get('partial') is None
+    assert os.listdir(cache.directory) == ['foo']
+
+
+def test_should_return_cached_toc_without_rendering(tmp_path):
+    cache = ResultCache(directory=os.path.join(tmp_path, 'cache'))
+    path = os.path.join(tmp_path, 'doc.md')
+    with open(path, 'w') as testfile:
+        testfile.write('# foo\n')
+    md_helper = MarkdownHelper(path, cache=cache)
+    content = list(md_helper.add_toc_content())
+    assert content == list(MarkdownHelper(path).add_toc_content())
+    key = cache.key(b'# foo\n', dict(command='add_toc', add_navigation=False, top_level=0, sub_level=0))
+    assert cache.get(key) == content
+    cache.put(key, ['cached'])
+    assert list(md_helper.add_toc_content()) == ['cached']
+    assert list(md_helper.add_toc_content(top_level=1)) == content
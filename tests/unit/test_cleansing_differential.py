@@ -0,0 +1,43 @@
+import itertools
+import re
+
+from markdown_helper import MarkdownDocument, MarkdownParser
+
+FRAGMENTS = ['', '#', '# ', '## ', '[', '](#1_2)', '[↖](#top)', '[↑](#1)', ')', ' ', 'a', 'Z', '<a name="1"></a>', '<a', 'name', 'a>', '<a href="x">link</a>', 'text (core)', '#[', '# [']
+
+
+def reference_cleansing(lines):
+    for line in MarkdownDocument._remove_existing_tocs(lines):
+        if line != '':
+            line = re.sub(MarkdownDocument.REG_SPACER_BETWEEN_HEADER_AND_LINK, '', line)
+            line = re.sub(MarkdownDocument.REG_INTERNAL_ANCHOR, '', line)
+            line = re.sub(MarkdownDocument.REG_INTERNAL_LINK, '', line)
+            if line:
+                yield line
+        else:
+            yield line
+
+
+def corpus():
+    for length in range(4):
+        for fragments in itertools.product(FRAGMENTS, repeat=length):
+            yield ''.join(fragments)
+
+
+def rendered_corpus():
+    raw_lines = ['foo', '# bar (core)', '', '## bum', 'text with # hash', '### baz', '<a name="x"></a> inline', '# klo']
+    md_document = MarkdownDocument(raw_lines)
+    for top_level, sub_level in itertools.product(range(3), range(3)):
+        yield from md_document.dump(with_toc=True, max_main_toc_level=top_level, extra_sub_toc_level=sub_level)
+
+
+def test_cleansing_should_match_reference_on_fragment_corpus():
+    lines = list(corpus())
+    assert len(lines) > 8000
+    assert list(MarkdownDocument._cleansing_generator(lines)) == list(reference_cleansing(lines))
+
+
+def test_cleansing_should_match_reference_on_rendered_documents():
+    lines = list(rendered_corpus())
+    assert list(MarkdownDocument._cleansing_generator(lines)) == list(reference_cleansing(lines))
+    assert [line for line in MarkdownDocument._cleansing_generator(lines) if MarkdownParser()._is_heading(line)][:2] == ['# bar (core)', '## bum']
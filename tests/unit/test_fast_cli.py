@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+
+from markdownhelper.fast_cli import _parse_fast_path, main
+
+
+def test_should_parse_fast_path_arguments(doc):
+    assert _parse_fast_path(['cleanse', doc]) == ('cleanse', [doc], dict(in_place=False, check=False))
+    assert _parse_fast_path(['toc', '--top-level', '0', '--sub-level=1', '--bbbno-navigation', '--no-cache', doc]) == \
+        ('toc', [doc], dict(top_level=0, sub_level=1, navigation=False, max_toc_entries=0, cache=False, in_place=False, check=False))
+    assert _parse_fast_path(['toc', '--max-toc-entries', '50', doc])[2]['max_toc_entries'] == 50
+    assert _parse_fast_path(['toc', doc, '--in-place'])[2]['in_place'] is True
+
+
+def test_should_fall_back_to_click_for_everything_else(doc, tmp_path):
+    assert _parse_fast_path([]) is None
+    assert _parse_fast_path(['dump', doc]) is None
+    assert _parse_fast_path(['toc', '--help']) is None
+    assert _parse_fast_path(['toc', '--jobs', '2', doc]) is None
+    assert _parse_fast_path(['toc', '--top-level', 'x', doc]) is None
+    assert _parse_fast_path(['toc', '--in-place', '--check', doc]) is None
+    assert _parse_fast_path(['toc', '--max-toc-entries', '1', doc]) is None
+    assert _parse_fast_path(['toc', doc, doc]) is None
+    assert _parse_fast_path(['toc', str(tmp_path)]) is None
+
+
+def test_should_render_toc_on_fast_path(doc, capsys):
+    assert main(['toc', '--top-level', '0', '--no-cache', doc]) == 0
+    assert capsys.readouterr().out.splitlines()[-2:] == ['# [↖](#top) foo', 'bar']
+
+
+def test_should_not_import_click_on_fast_path():
+    src = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'src')
+    code = 'import sys, markdownhelper.fast_cli; print("click" in sys.modules, "concurrent.futures" in sys.modules)'
+    output = subprocess.run([sys.executable, '-c', code], env=dict(os.environ, PYTHONPATH=src), stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+    assert output.split() == ['False', 'False']
@@ -0,0 +1,77 @@
+import json
+import os
+
+import pytest
+
+from markdownhelper.batch import ERROR
+from markdownhelper.index import PARSED, REMOVED, REUSED, DocumentIndex
+
+
+@pytest.fixture
+def docs(tmp_path):
+    os.makedirs(os.path.join(tmp_path, 'docs', 'guide'))
+    files = {
+        'docs/a.md': '# Foo\n## Bar\n```\n# not a heading\n```\n',
+        'docs/guide/b c.md': '<!-- toc_start -->\n* [Baz](#1)\n<!-- toc_end -->\n<a name="1"></a>\n# [↖](#top) Baz\n### Deep\n',
+    }
+    for name, content in files.items():
+        with open(os.path.join(tmp_path, name), 'w') as testfile:
+            testfile.write(content)
+    return tmp_path
+
+
+def run_index(docs, **kwargs):
+    document_index = DocumentIndex(os.path.join(docs, 'docs', 'INDEX.md'), **kwargs)
+    document_index.update([os.path.join(docs, 'docs')])
+    return document_index
+
+
+def read_index(docs):
+    with open(os.path.join(docs, 'docs', 'INDEX.md')) as index_file:
+        return index_file.read().split('\n')[:-1]
+
+
+def test_should_write_linked_index(docs):
+    document_index = run_index(docs)
+    assert [result.status for result in document_index.results] == [PARSED, PARSED]
+    assert document_index.changed
+    assert read_index(docs) == [
+        '# Index',
+        '',
+        '* [a.md](a.md)',
+        '  * [Foo](a.md#1)',
+        '    * [Bar](a.md#1_1)',
+        '* [guide/b c.md](guide/b%20c.md)',
+        '  * [Baz](guide/b%20c.md#1)',
+        '      * [Deep](guide/b%20c.md#1_1)',
+    ]
+    run_index(docs, top_level=1)
+    assert read_index(docs)[2:] == ['* [a.md](a.md)', '  * [Foo](a.md#1)', '* [guide/b c.md](guide/b%20c.md)', '  * [Baz](guide/b%20c.md#1)']
+    run_index(docs, toc_top_level=1, toc_sub_level=1)
+    assert read_index(docs)[2:] == ['* [a.md](a.md)', '  * [Foo](a.md#1)', '    * [Bar](a.md#1_1)', '* [guide/b c.md](guide/b%20c.md)', '  * [Baz](guide/b%20c.md#1)']
+
+
+def test_should_reparse_only_changed_files(docs):
+    run_index(docs)
+    document_index = run_index(docs)
+    assert [result.status for result in document_index.results] == [REUSED, REUSED]
+    assert not document_index.changed
+    os.utime(os.path.join(docs, 'docs', 'a.md'), ns=(0, 0))
+    with open(os.path.join(docs, 'docs', 'guide', 'b c.md'), 'a') as testfile:
+        testfile.write('# Qux\n')
+    document_index = run_index(docs)
+    assert [result.status for result in document_index.results] == [REUSED, PARSED]
+    assert read_index(docs)[-1] == '  * [Qux](guide/b%20c.md#2)'
+    with open(os.path.join(docs, 'docs', '.mdh_index.json')) as index_file:
+        assert json.load(index_file)['documents']['a.md'][0] == 0
+
+
+def test_should_drop_removed_and_invalid_files(docs):
+    run_index(docs)
+    os.unlink(os.path.join(docs, 'docs', 'a.md'))
+    with open(os.path.join(docs, 'docs', 'guide', 'b c.md'), 'w') as testfile:
+        testfile.write('<!-- toc_start -->\n')
+    document_index = run_index(docs)
+    assert [result.status for result in document_index.results] == [ERROR, REMOVED]
+    assert document_index.entries == {}
+    assert read_index(docs) == ['# Index', '']
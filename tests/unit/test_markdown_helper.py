@@ -2,7 +2,7 @@ import re
 
 import pytest
 
-from markdown_helper import MarkdownParser, MarkdownDocument, MarkdownLine, MarkdownHeading, HeadingIndices
+from markdown_helper import BlockScanner, HeadingIndex, MarkdownParser, MarkdownDocument, MarkdownLine, MarkdownHeading, HeadingIndices, InvalidTocError, Metrics, collect_metrics
 
 
 @pytest.fixture
@@ -95,29 +95,115 @@ def test_should_fail_if_generate_index_is_called_for_zero_heading_level():
         mdp._generate_index((), 0)
 
 
+def generated_indices(mdp, levels):
+    indices, current_index = [], ()
+    for level in levels:
+        current_index = mdp._generate_index(current_index, level)
+        indices.append(current_index)
+    return indices
+
+
+def test_should_compute_same_heading_index_as_generate_index(mdp):
+    levels = [3, 1, 2, 4, 4, 2, 1, 3, 2, 1, 1, 6, 5, 2]
+    heading_index = HeadingIndex(levels)
+    assert list(heading_index) == generated_indices(mdp, levels)
+    assert heading_index[4] == (2, 1, 1, 1)
+    assert heading_index._paths[1] is heading_index[1]
+    assert list(HeadingIndex([])) == []
+
+
+def test_should_compute_same_heading_index_with_numpy(mdp, monkeypatch):
+    pytest.importorskip('numpy')
+    monkeypatch.setattr(HeadingIndex, 'NUMPY_THRESHOLD', 1)
+    levels = [((number * 7) % 5) + 1 for number in range(200)]
+    assert list(HeadingIndex(levels)) == generated_indices(mdp, levels)
+
+
 def test_should_parse(mdp):
     lines = mdp.parse(['foo', '# bar', 'bas', '# bum'])
     assert lines[1].heading_indices == HeadingIndices(previous=(), current=(1,), next=(2,))
     assert lines[3].heading_indices == HeadingIndices(previous=(1,), current=(2,), next=())
 
 
+def test_should_build_heading_tree(mdp):
+    lines = mdp.parse(['foo', '# bar', '## bum', '### baz', '## bam', '# klo'])
+    tree = MarkdownParser.build_heading_tree(lines)
+    assert tree[()] == [lines[1], lines[5]]
+    assert tree[(1,)] == [lines[2], lines[4]]
+    assert tree[(1, 1)] == [lines[3]]
+    assert (2,) not in tree
+
+
+def test_should_parse_compact(mdp):
+    store = mdp.parse_compact(['foo', '# bar', 'bas', '## bum', '# klo'])
+    assert len(store) == 5
+    assert list(store.heading_positions) == [1, 3, 4]
+    assert list(store.heading_levels) == [1, 2, 1]
+    assert list(store.heading_paths) == [(1,), (1, 1), (2,)]
+    assert store._headings == [None, None, None]
+    assert store[3].heading_indices == HeadingIndices(previous=(1,), current=(1, 1), next=(2,))
+    assert store[3] is store.heading(1)
+    assert isinstance(store[2], MarkdownLine) and store[2].raw_text == 'bas'
+    assert store.iter_compact().__next__() == 'foo'
+
+
+def test_should_parse_headings_deeper_than_a_byte(mdp):
+    raw_lines = ['# foo', '#' * 300 + ' bar', '## baz']
+    store = mdp.parse_compact(raw_lines)
+    assert list(store.heading_levels) == [1, 300, 2]
+    assert list(store.heading_paths) == [(1,), (1, 1), (1, 2)]
+    assert [line.heading_indices.current for line in mdp.parse(raw_lines) if isinstance(line, MarkdownHeading)] == [(1,), (1, 1), (1, 2)]
+
+
+def test_should_store_same_headings_as_parse(mdp):
+    raw_lines = ['foo', '### bar', '# bas', '## bum', '# klo', 'baz']
+    parsed = mdp.parse(raw_lines)
+    store = mdp.parse_compact(raw_lines)
+    assert [str(line) for line in store] == raw_lines
+    assert [line.heading_indices for line in store.iter_headings()] == [line.heading_indices for line in parsed if isinstance(line, MarkdownHeading)]
+
+
+def test_should_classify_blocks():
+    lines = ['# bar', '```bash', '# comment', '``', '```', 'text', '    # indented', '', '    code', '', '~~~~', '# comment', '~~~~~',
+             '<!-- a', '# comment', '-->', '<details>', '# summary', '', '<a name="1"></a>', '# baz', '``` `x`', '# qux']
+    kinds = [kind for _, kind in BlockScanner().scan(lines)]
+    assert kinds == ['heading', 'fence', 'code', 'code', 'fence', 'text', 'text', 'blank', 'code', 'blank', 'fence', 'code', 'fence',
+                     'html', 'html', 'html', 'html', 'html', 'blank', 'text', 'heading', 'text', 'heading']
+
+
+def test_should_not_parse_headings_in_code_blocks(mdp):
+    raw_lines = ['# bar', '```', '# comment', '```', '<pre>', '# comment', '</pre>', '## bum', '```yaml', '# unclosed']
+    assert [line.raw_text for line in mdp.parse(raw_lines) if isinstance(line, MarkdownHeading)] == ['# bar', '## bum']
+    assert list(mdp.parse_compact(raw_lines).heading_positions) == [0, 7]
+    content = list(MarkdownDocument.stream(lambda: iter(raw_lines), with_toc=True))
+    assert content[3:5] == ['* [bar](#1)', '  * [bum](#1_1)']
+    assert content[9:15] == raw_lines[1:7]
+    assert content[-2:] == raw_lines[-2:]
+
+
 # --- mdd tests
 
 
 def test_should_remove_existing_tocs(mdd):
-    assert mdd._remove_existing_tocs([]) == []
-    assert mdd._remove_existing_tocs(['foo']) == ['foo']
-    assert mdd._remove_existing_tocs(['foo', mdd.TOC_EMPTY_LINE, mdd.TOC_START, 'bar', mdd.TOC_EMPTY_LINE, mdd.TOC_END, 'baz']) == ['foo', 'baz']
-    assert mdd._remove_existing_tocs(['foo', mdd.TOC_EMPTY_LINE, mdd.TOC_START, 'bar', mdd.TOC_EMPTY_LINE, mdd.TOC_END, 'baz', 'foo', mdd.TOC_EMPTY_LINE, mdd.TOC_START, 'bar', mdd.TOC_EMPTY_LINE, mdd.TOC_END, 'baz']) == ['foo', 'baz', 'foo', 'baz']
+    assert list(mdd._remove_existing_tocs([])) == []
+    assert list(mdd._remove_existing_tocs(['foo'])) == ['foo']
+    assert list(mdd._remove_existing_tocs(['foo', mdd.TOC_EMPTY_LINE, mdd.TOC_START, 'bar', mdd.TOC_EMPTY_LINE, mdd.TOC_END, 'baz'])) == ['foo', 'baz']
+    assert list(mdd._remove_existing_tocs(['foo', mdd.TOC_EMPTY_LINE, mdd.TOC_START, 'bar', mdd.TOC_EMPTY_LINE, mdd.TOC_END, 'baz', 'foo', mdd.TOC_EMPTY_LINE, mdd.TOC_START, 'bar', mdd.TOC_EMPTY_LINE, mdd.TOC_END, 'baz'])) == ['foo', 'baz', 'foo', 'baz']
+
+
+def test_should_only_remove_single_empty_line_before_toc(mdd):
+    assert list(mdd._remove_existing_tocs(['foo', mdd.TOC_EMPTY_LINE, mdd.TOC_EMPTY_LINE, mdd.TOC_START, mdd.TOC_END, mdd.TOC_EMPTY_LINE, 'baz', mdd.TOC_EMPTY_LINE])) == ['foo', mdd.TOC_EMPTY_LINE, mdd.TOC_EMPTY_LINE, 'baz', mdd.TOC_EMPTY_LINE]
 
 
 def test_should_fail_if_trying_to_remove_unbalanced_toc(mdd):
-    with pytest.raises(AssertionError):
-        mdd._remove_existing_tocs([mdd.TOC_START])
-    with pytest.raises(AssertionError):
-        mdd._remove_existing_tocs([mdd.TOC_END])
-    with pytest.raises(AssertionError):
-        mdd._remove_existing_tocs([mdd.TOC_END, mdd.TOC_START])
+    with pytest.raises(InvalidTocError):
+        list(mdd._remove_existing_tocs([mdd.TOC_START]))
+    with pytest.raises(InvalidTocError):
+        list(mdd._remove_existing_tocs([mdd.TOC_END]))
+    with pytest.raises(InvalidTocError):
+        list(mdd._remove_existing_tocs([mdd.TOC_END, mdd.TOC_START]))
+    with pytest.raises(InvalidTocError, match='Nested'):
+        list(mdd._remove_existing_tocs([mdd.TOC_START, mdd.TOC_START, mdd.TOC_END, mdd.TOC_END]))
 
 
 def test_reg_ex_for_internal_link(mdd):
@@ -174,6 +260,14 @@ def test_is_in_toc_should_fail_if_called_with_markdownline(mdd):
         mdd._is_line_in_toc(line, (), 0, 0)
 
 
+def test_should_iterate_sub_headings_in_document_order(mdp, mdd):
+    lines = mdp.parse(['foo', '# bar', '## bum', '### baz', '## bam', '# klo'])
+    mdd.md_lines = lines
+    assert list(mdd._iter_sub_headings(())) == [lines[1], lines[2], lines[3], lines[4], lines[5]]
+    assert list(mdd._iter_sub_headings((1,))) == [lines[2], lines[3], lines[4]]
+    assert list(mdd._iter_sub_headings((2,))) == []
+
+
 def test_should_only_return_toc_if_it_has_elements(mdp, mdd):
     lines = mdp.parse(['foo'])
     mdd.md_lines = lines
@@ -206,6 +300,70 @@ def test_should_dump_with_main_and_sub_toc(mdp, mdd):
     assert mdd.dump(with_toc=True, max_main_toc_level=1, extra_sub_toc_level=2) == [MarkdownDocument.TOC_START, MarkdownDocument.TOC_TOP_ANCHOR, MarkdownDocument.TOC_RULER, '* [bar](#1)', '* [klo](#2)', MarkdownDocument.TOC_RULER, MarkdownDocument.TOC_END, 'foo', '<a name="1"></a>', '# [↖](#top)[↓](#1_1) bar', MarkdownDocument.TOC_START, '* [bum](#1_1)', '  * [baz](#1_1_1)', MarkdownDocument.TOC_END, '<a name="1_1"></a>', '## [↖](#1)[↑](#1)[↓](#1_1_1) bum', '<a name="1_1_1"></a>', '### [↖](#1)[↑](#1_1)[↓](#2) baz', '<a name="2"></a>', '# [↖](#top)[↑](#1_1_1) klo']
 
 
+def test_should_page_overflowing_toc_entries_into_sub_tocs(mdp, mdd):
+    raw_lines = ['# a', '## a1', '### a1x', '### a1y', '## a2', '# b', '## b1', '## b2', '### b2x']
+    mdd.md_lines = mdp.parse(raw_lines)
+    content = mdd.dump(with_toc=True, max_toc_entries=3)
+    assert content[:7] == [MarkdownDocument.TOC_START, MarkdownDocument.TOC_TOP_ANCHOR, MarkdownDocument.TOC_RULER, '* [a](#1)', '* [b](#2)', MarkdownDocument.TOC_RULER, MarkdownDocument.TOC_END]
+    assert content[9:13] == [MarkdownDocument.TOC_START, '* [a1](#1_1)', '* [a2](#1_2)', MarkdownDocument.TOC_END]
+    assert content[15:19] == [MarkdownDocument.TOC_START, '* [a1x](#1_1_1)', '* [a1y](#1_1_2)', MarkdownDocument.TOC_END]
+    assert content[27:32] == [MarkdownDocument.TOC_START, '* [b1](#2_1)', '* [b2](#2_2)', '  * [b2x](#2_2_1)', MarkdownDocument.TOC_END]
+    assert sum(1 for line in content if line == MarkdownDocument.TOC_START) == 4
+    assert list(MarkdownDocument.stream(lambda: iter(raw_lines), with_toc=True, max_toc_entries=3)) == content
+    assert mdd.dump(with_toc=True, max_main_toc_level=1, extra_sub_toc_level=1, max_toc_entries=100) == mdd.dump(with_toc=True, max_main_toc_level=1, extra_sub_toc_level=1)
+    assert mdd.dump(with_toc=True, max_toc_entries=100) == mdd.dump(with_toc=True)
+
+
+def test_should_split_overflowing_level_into_toc_pages(mdp, mdd):
+    raw_lines = ['# t'] + [f'## s{i}' for i in range(12)] + ['### x']
+    mdd.md_lines = mdp.parse(raw_lines)
+    content = mdd.dump(with_toc=True, max_toc_entries=2)
+    assert content[8:12] == [MarkdownDocument.TOC_START, '* [s0 – s7](#toc3_1_1)', '* [s8 – s11](#toc3_1_9)', MarkdownDocument.TOC_END]
+    assert content[12:16] == [MarkdownDocument.TOC_START, '<a name="toc3_1_1"></a>', '* [s0 – s3](#toc2_1_1)', '* [s4 – s7](#toc2_1_5)']
+    assert content[23:28] == ['<a name="toc1_1_1"></a>', '* [s0](#1_1)', '* [s1](#1_2)', MarkdownDocument.TOC_END, '<a name="1_1"></a>']
+    sizes = []
+    for line in content:
+        if line == MarkdownDocument.TOC_START:
+            sizes.append(0)
+        elif line.startswith('* ['):
+            sizes[-1] += 1
+    assert len(sizes) == 14 and max(sizes) <= 2
+    assert list(MarkdownDocument.stream(lambda: iter(raw_lines), with_toc=True, max_toc_entries=2)) == content
+    assert list(MarkdownDocument.stream(lambda: iter(content), remove_old_toc=True, with_toc=True, max_toc_entries=2)) == content
+
+
+@pytest.mark.parametrize('raw_lines, max_toc_entries', [
+    (['# A', '## a1', '## a2', '# B', '### b1', '### b2'], 4),
+    (['### h0', '# h1', '## h2', '# h3'], 3),
+    (['#### h0', '## h1', '# h2', '#### h3', '# h4', '### h5', '### h6', '## h7', '# h8', '##### h9'], 2),
+])
+def test_should_list_every_heading_in_exactly_one_paged_toc(raw_lines, max_toc_entries):
+    content = list(MarkdownDocument.stream(lambda: iter(raw_lines), with_toc=True, max_toc_entries=max_toc_entries))
+    sizes = []
+    listed = []
+    for line in content:
+        if line == MarkdownDocument.TOC_START:
+            sizes.append(0)
+        elif line.lstrip().startswith('* ['):
+            sizes[-1] += 1
+            if ' – ' not in line:
+                listed.append(line.lstrip()[3:line.lstrip().index(']')])
+    assert sorted(listed) == sorted(line.split()[1] for line in raw_lines)
+    assert max(sizes) <= max_toc_entries
+
+
+def test_should_iterate_dump_lazily(mdp, mdd, monkeypatch):
+    mdd.md_lines = mdp.parse(['foo', '# bar', '## bum', '### baz', '# klo'])
+    options = dict(with_toc=True, max_main_toc_level=1, extra_sub_toc_level=2)
+    rendered_toc_entries = []
+    to_toc_entry = MarkdownHeading.to_toc_entry
+    monkeypatch.setattr(MarkdownHeading, 'to_toc_entry', lambda heading, base_heading: rendered_toc_entries.append(heading) or to_toc_entry(heading, base_heading))
+    content = mdd.iter_dump(**options)
+    assert next(content) == MarkdownDocument.TOC_START
+    assert len(rendered_toc_entries) == 1
+    assert [MarkdownDocument.TOC_START] + list(content) == mdd.dump(**options)
+
+
 def test_should_not_render_anchors_if_line_is_not_linked_to(mdp, mdd):
     lines = mdp.parse(['foo', '# bar', '## bum', '### baz', '# klo'])
     mdd.md_lines = lines
@@ -216,3 +374,40 @@ def test_should_render_navigation_links(mdp, mdd):
     lines = mdp.parse(['foo', '# bar', '## bum', '### baz', '# klo'])
     mdd.md_lines = lines
     assert mdd.dump(with_toc=True, max_main_toc_level=1) == [MarkdownDocument.TOC_START, MarkdownDocument.TOC_TOP_ANCHOR, MarkdownDocument.TOC_RULER, '* [bar](#1)', '* [klo](#2)', MarkdownDocument.TOC_RULER, MarkdownDocument.TOC_END, 'foo', '<a name="1"></a>', '# [↖](#top)[↓](#1_1) bar', '## bum', '### baz', '<a name="2"></a>', '# [↖](#top)[↑](#1_1_1) klo']
+
+
+def test_should_stream_same_content_as_dump(mdp, mdd):
+    raw_lines = ['foo', '# bar', '## bum', '### baz', '# klo']
+    mdd.md_lines = mdp.parse(raw_lines)
+    assert list(MarkdownDocument.stream(lambda: iter(raw_lines))) == mdd.dump()
+    assert list(MarkdownDocument.stream(lambda: iter(raw_lines), with_debug=True)) == mdd.dump(with_debug=True)
+    assert list(MarkdownDocument.stream(lambda: iter(raw_lines), with_toc=True, max_main_toc_level=1, extra_sub_toc_level=2)) == mdd.dump(with_toc=True, max_main_toc_level=1, extra_sub_toc_level=2)
+
+
+def test_should_read_twice_when_streaming_with_toc():
+    read_calls = []
+
+    def read_lines():
+        read_calls.append(True)
+        return iter(['foo', '# bar', 'bum', '# klo'])
+
+    content = MarkdownDocument.stream(read_lines, with_toc=True)
+    assert list(content)[-1] == '# [↖](#top)[↑](#1) klo'
+    assert len(read_calls) == 2
+
+
+def test_should_collect_metrics_per_stage():
+    raw_lines = ['<!-- toc_start -->', '* [bar](#1)', '<!-- toc_end -->', 'foo', '# bar', '## bum', '# klo']
+    with collect_metrics() as metrics:
+        content = list(MarkdownDocument.stream(lambda: iter(raw_lines), remove_old_toc=True, with_toc=True, max_main_toc_level=1, extra_sub_toc_level=1))
+    assert content == list(MarkdownDocument.stream(lambda: iter(raw_lines), remove_old_toc=True, with_toc=True, max_main_toc_level=1, extra_sub_toc_level=1))
+    assert metrics.counters == dict(tocs_removed=1, headings=3, sub_tocs=1)
+    assert {'remove_tocs', 'cleanse', 'parse', 'create_toc', 'render'} <= set(metrics.timings)
+    assert all(seconds >= 0 for seconds in metrics.timings.values())
+
+
+def test_should_merge_metrics():
+    metrics = Metrics()
+    metrics.count('headings', 2)
+    metrics.merge(dict(timings=dict(parse=0.5), counters=dict(headings=3)))
+    assert metrics.as_dict() == dict(timings=dict(parse=0.5), counters=dict(headings=5))
@@ -2,7 +2,8 @@ import os
 
 import pytest
 
-from markdown_helper import MarkdownHelper
+from markdown_helper import FileDescriptorSink, InvalidTocError, MarkdownHelper, MemorySink
+from markdownhelper.cache import ResultCache
 
 
 @pytest.fixture
@@ -26,3 +27,98 @@ def test_should_add_and_remove_toc(mdh, capsys, tmp_path):
     result_no_toc, _ = capsys.readouterr()
 
     assert result_no_toc == expected_no_toc
+
+
+def test_should_only_rewrite_changed_files(tmp_path):
+    path = os.path.join(tmp_path, 'doc.md')
+    with open(path, 'w') as testfile:
+        testfile.write('# foo\nbar\n')
+    os.utime(path, (0, 0))
+    md_helper = MarkdownHelper(path)
+
+    assert md_helper.is_changed(md_helper.cleanse_content()) is False
+    assert md_helper.write_content(md_helper.cleanse_content()) is False
+    assert os.stat(path).st_mtime == 0
+
+    assert md_helper.is_changed(md_helper.add_toc_content()) is True
+    assert md_helper.write_content(md_helper.add_toc_content()) is True
+    assert os.stat(path).st_mtime != 0
+    assert md_helper.is_changed(md_helper.add_toc_content()) is False
+    assert md_helper.is_changed(['# foo']) is True
+    assert os.listdir(tmp_path) == ['doc.md']
+
+
+def test_should_rewrite_target_of_symlink(tmp_path):
+    os.makedirs(os.path.join(tmp_path, 'real'))
+    path = os.path.join(tmp_path, 'real', 'doc.md')
+    link = os.path.join(tmp_path, 'link.md')
+    with open(path, 'w') as testfile:
+        testfile.write('# foo\nbar\n')
+    os.symlink(os.path.join('real', 'doc.md'), link)
+    md_helper = MarkdownHelper(link)
+
+    assert md_helper.write_content(md_helper.add_toc_content()) is True
+    assert os.path.islink(link)
+    assert MarkdownHelper(path).is_changed(md_helper.add_toc_content()) is False
+    assert sorted(os.listdir(tmp_path)) == ['link.md', 'real']
+    assert os.listdir(os.path.join(tmp_path, 'real')) == ['doc.md']
+
+
+def test_should_write_same_content_to_every_sink(mdh, capsys, tmp_path):
+    mdh.add_toc(add_navigation=True, top_level=2, sub_level=2)
+    printed, _ = capsys.readouterr()
+    assert mdh.add_toc(add_navigation=True, top_level=2, sub_level=2, sink=MemorySink()).getvalue() == printed
+
+    path = os.path.join(tmp_path, 'out.md')
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT)
+    try:
+        assert mdh.add_toc(add_navigation=True, top_level=2, sub_level=2, sink=FileDescriptorSink(fd, encoding='utf-8')) is not None
+    finally:
+        os.close(fd)
+    with open(path, encoding='utf-8') as testfile:
+        assert testfile.read() == printed
+
+
+def test_should_write_lines_in_chunks():
+    sink = MemorySink()
+    sink.CHUNK_LINES = 3
+    assert sink.write_lines(['foo', 'bär', 'baz', '']) == 14
+    assert sink.chunks == ['foo\nbär\nbaz\n'.encode(), b'\n']
+    assert sink.lines() == ['foo', 'bär', 'baz', '']
+
+
+@pytest.mark.parametrize('content', [
+    '# foo\n<!-- toc_start -->\n* [foo](#1)\n<!-- toc_end -->\nbar\n\n<!-- toc_start -->\n<!-- toc_end -->\n',
+    '<a name="1"></a>\n# [↖](#top)[↓](#2) foo\ntext with a #[link](#1) \n```sh\n# comment\n```\n<div>\n# hidden\n\n## bar\n  ~~~\nbaz',
+    '\n',
+])
+def test_should_write_same_content_when_memory_mapped(tmp_path, content):
+    path = os.path.join(tmp_path, 'doc.md')
+    with open(path, 'w', encoding='utf-8') as testfile:
+        testfile.write(content)
+    for command, options in (('cleanse', {}), ('dump', dict(with_debug=True)), ('add_toc', dict(add_navigation=True, top_level=1, sub_level=1))):
+        expected = getattr(MarkdownHelper(path, mapped=False), command)(sink=MemorySink(), **options).getvalue()
+        assert getattr(MarkdownHelper(path, mapped=True), command)(sink=MemorySink(), **options).getvalue() == expected
+
+
+@pytest.mark.parametrize('content', ['# foo\nbar\n## baz\n', '# foo\nbar\n## baz', 'bar\n'])
+def test_should_check_and_rewrite_when_memory_mapped(tmp_path, content):
+    path = os.path.join(tmp_path, 'doc.md')
+    with open(path, 'w', encoding='utf-8') as testfile:
+        testfile.write(content)
+    md_helper = MarkdownHelper(path, cache=ResultCache(os.path.join(tmp_path, 'cache')), mapped=True)
+    expected = list(MarkdownHelper(path, mapped=False).add_toc_content())
+    assert md_helper.is_changed(md_helper.add_toc_content(mapped=True)) == MarkdownHelper(path, mapped=False).is_changed(expected)
+    assert not md_helper.write_content(md_helper.cleanse_content(mapped=True))
+    assert md_helper.write_content(md_helper.add_toc_content(mapped=True)) == (content != 'bar\n')
+    assert not md_helper.is_changed(md_helper.add_toc_content(mapped=True))
+    with open(path, encoding='utf-8') as testfile:
+        assert testfile.read().split('\n')[:-1] == expected
+
+
+def test_should_report_same_toc_error_when_memory_mapped(tmp_path):
+    path = os.path.join(tmp_path, 'doc.md')
+    with open(path, 'w') as testfile:
+        testfile.write('foo\nbar\n<!-- toc_end -->\n')
+    with pytest.raises(InvalidTocError, match='in line 3'):
+        MarkdownHelper(path, mapped=True).cleanse(sink=MemorySink())
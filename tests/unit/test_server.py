@@ -0,0 +1,96 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import pytest
+
+from markdownhelper.fast_cli import client
+from markdownhelper.markdown_helper import MarkdownHelper
+from markdownhelper.server import INVALID_PARAMS, METHOD_NOT_FOUND, PARSE_ERROR, SERVER_ERROR, MarkdownServer, MarkdownSocketServer, UnsafeSocketError, call, default_socket_path
+
+
+@pytest.fixture
+def socket_path():
+    directory = tempfile.mkdtemp()
+    yield os.path.join(directory, 'mdh.sock')
+    shutil.rmtree(directory)
+
+
+def test_should_answer_requests(doc):
+    server = MarkdownServer()
+    response = server.handle(dict(jsonrpc='2.0', id=7, method='add_toc', params=dict(path=doc)))
+    assert response == dict(jsonrpc='2.0', id=7, result=dict(content=list(MarkdownHelper(doc).add_toc_content())))
+    assert server.handle(dict(id=1, method='cleanse', params=dict(path=doc)))['result']['content'] == ['# foo', 'bar']
+    assert server.handle(dict(id=1, method='dump', params=dict(path=doc, with_debug=True)))['result']['content'] == ['# (1,) foo', 'bar']
+
+
+def test_should_report_errors(doc):
+    server = MarkdownServer()
+    assert server.handle(dict(id=1, method='unknown'))['error']['code'] == METHOD_NOT_FOUND
+    assert server.handle(dict(id=1, method='cleanse', params=dict(path=doc, foo=1)))['error']['code'] == INVALID_PARAMS
+    assert server.handle(dict(id=1, method='cleanse', params=dict(path='missing.md')))['error']['code'] == SERVER_ERROR
+    assert json.loads(server.handle_line('{'))['error']['code'] == PARSE_ERROR
+
+
+def test_should_keep_documents_warm_until_file_changes(doc):
+    server = MarkdownServer(max_documents=1)
+    md_document = server._document(doc, True)
+    assert server._document(doc, True) is md_document
+    with open(doc, 'a') as testfile:
+        testfile.write('# klo\n')
+    assert server._document(doc, True) is not md_document
+    assert server.cleanse(doc) == ['# foo', 'bar', '# klo']
+    server._document(doc, False)
+    assert list(server._documents) == [(os.path.abspath(doc), False)]
+
+
+def test_should_serve_stdio(doc):
+    stdout = io.StringIO()
+    MarkdownServer().serve_stdio(io.StringIO(json.dumps(dict(id=1, method='cleanse', params=dict(path=doc))) + '\n\n'), stdout)
+    assert json.loads(stdout.getvalue())['result']['content'] == ['# foo', 'bar']
+
+
+def test_should_serve_socket_and_fall_back_without_server(doc, socket_path, capsys):
+    assert client(['cleanse', doc], socket_path) == 0
+    assert capsys.readouterr().out == '# foo\nbar\n'
+
+    with MarkdownSocketServer(socket_path) as server:
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            assert call('cleanse', dict(path=doc), socket_path) == ['# foo', 'bar']
+            assert client(['toc', '--top-level', '0', doc], socket_path) == 0
+            assert capsys.readouterr().out.splitlines()[-2:] == ['# [↖](#top) foo', 'bar']
+        finally:
+            server.shutdown()
+            thread.join()
+    assert not os.path.exists(socket_path)
+
+
+def test_should_refuse_sockets_accessible_to_others(doc, socket_path, capsys):
+    with MarkdownSocketServer(socket_path):
+        assert os.stat(socket_path).st_mode & 0o777 == 0o600
+        os.chmod(socket_path, 0o666)
+        with pytest.raises(UnsafeSocketError):
+            call('cleanse', dict(path=doc), socket_path)
+        assert client(['cleanse', doc], socket_path) == 1
+        assert capsys.readouterr().out == ''
+    with open(socket_path, 'w'):
+        pass
+    with pytest.raises(UnsafeSocketError):
+        MarkdownSocketServer(socket_path)
+
+
+def test_should_keep_default_socket_in_private_directory(tmp_path, monkeypatch):
+    monkeypatch.delenv('MDH_SOCKET', raising=False)
+    monkeypatch.delenv('XDG_RUNTIME_DIR', raising=False)
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    path = default_socket_path()
+    assert os.path.dirname(path) == os.path.join(str(tmp_path), f'mdh-{os.getuid()}')
+    assert os.stat(os.path.dirname(path)).st_mode & 0o777 == 0o700
+    os.chmod(os.path.dirname(path), 0o755)
+    with pytest.raises(UnsafeSocketError):
+        default_socket_path()
@@ -0,0 +1,40 @@
+from markdownhelper.toc_diff import Hunk, TocDiff, diff_lines
+from markdownhelper.markdown_helper import MarkdownDocument
+
+
+def render(lines):
+    return list(MarkdownDocument.stream(lambda: iter(lines), remove_old_toc=True, with_toc=True))
+
+
+def apply(hunks, lines):
+    result = []
+    position = 0
+    for hunk in hunks:
+        result.extend(lines[position:hunk.old_start])
+        result.extend(hunk.new_lines)
+        position = hunk.old_start + len(hunk.old_lines)
+    result.extend(lines[position:])
+    return result
+
+
+def test_should_not_patch_up_to_date_document():
+    lines = render(['foo', '# bar', '## bum', '# klo'])
+    toc_diff = TocDiff(lines)
+    assert toc_diff.hunks == []
+    assert toc_diff.unified_diff('doc.md') == []
+
+
+def test_should_only_patch_changed_headings_and_toc():
+    lines = render(['foo', '# bar', 'bam', '# klo'])
+    edited = lines[:-2] + ['# new'] + lines[-2:]
+    toc_diff = TocDiff(edited)
+    assert apply(toc_diff.hunks, edited) == toc_diff.new_lines == render(['foo', '# bar', 'bam', '# new', '# klo'])
+    assert toc_diff.hunks == [
+        Hunk(4, ['* [klo](#2)'], 4, ['* [new](#2)', '* [klo](#3)']),
+        Hunk(11, ['# new', '<a name="2"></a>', '# [↖](#top)[↑](#1) klo'], 12, ['<a name="2"></a>', '# [↖](#top)[↑](#1)[↓](#3) new', '<a name="3"></a>', '# [↖](#top)[↑](#2) klo']),
+    ]
+    assert toc_diff.unified_diff('doc.md')[:5] == ['--- doc.md', '+++ doc.md', '@@ -5,1 +5,2 @@', '-* [klo](#2)', '+* [new](#2)']
+
+
+def test_should_diff_documents_with_different_content():
+    assert diff_lines(['foo', 'bar'], ['foo', 'baz']) == [Hunk(1, ['bar'], 1, ['baz'])]